@@ -1,17 +1,122 @@
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import asyncio
 import aiohttp
-import datetime
+import threading
+import json
+from collections import defaultdict
+from functools import lru_cache
+from operator import itemgetter
+from urllib.parse import urlencode
+from typing import Any
+
+# orjson parses the large orderbook and order list payloads several times faster than the stdlib json module
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# uvloop's libuv based event loop has less per-await overhead than the default asyncio loop
+try:
+    import uvloop
+    new_event_loop = uvloop.new_event_loop
+except ImportError:
+    new_event_loop = asyncio.new_event_loop
+
+# Query shapes rebuilt every tick with only a handful of distinct values (orderbook ticker/limit pairs, order statuses),
+# the only ones worth memoizing. Order and cancel queries carry prices, quantities and ids that rarely repeat
+MEMOIZED_QUERY_SHAPES = (frozenset({'ticker', 'limit'}), frozenset({'status'}))
+
+
+def build_query(items) -> str:
+    """
+    url encode an iterable of (key, value) query parameters, dropping None values.
+    """
+    query = urlencode([(k, v) for k, v in items if v is not None])
+    return f'?{query}' if query else ''
+
+
+@lru_cache(maxsize=256)
+def encode_query(items: tuple) -> str:
+    """
+    Memoized build_query for the fixed query shapes in MEMOIZED_QUERY_SHAPES, the items must be hashable.
+    """
+    return build_query(items)
+
+
+@lru_cache(maxsize=4096)
+def order_endpoint(orders_url: str, order_id) -> str:
+    """
+    Build the endpoint for a single order, memoized since cancel/replace keeps hitting the same order ids.
+    """
+    return f'{orders_url}/{order_id}'
 
-with open('api_key.txt', 'r') as f:
-    API_KEY = f.read().strip()
+
+def load_api_key(path: str = 'api_key.txt') -> str:
+    """
+    Read the API key from disk. Only done when a client is actually needed, so importing this module does no I/O.
+    """
+    with open(path, 'r') as f:
+        return f.read().strip()
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter. Tokens refill continuously at `rate` per second up to `capacity`,
+    so bursts of up to `capacity` requests go out back-to-back and only sustained traffic above `rate` is throttled.
+    """
+    def __init__(self, rate: float = 100.0, capacity: float = 100.0):
+        self._refill_rate = float(rate)
+        self._capacity = float(capacity)
+        self._tokens = self._capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, cost: float) -> float:
+        """
+        Refill the bucket and try to take `cost` tokens.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of seconds to wait before trying again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self._refill_rate)
+            self._last_refill = now
+
+            if self._tokens >= cost:
+                self._tokens -= cost
+                return 0.0
+            return (cost - self._tokens) / self._refill_rate
+
+    def acquire(self, cost: float = 1):
+        """
+        Block with time.sleep until `cost` tokens are available, then take them.
+        """
+        wait_time = self._take(cost)
+        while wait_time > 0:
+            time.sleep(wait_time)
+            wait_time = self._take(cost)
+
+    async def acquire_async(self, cost: float = 1):
+        """
+        Same as acquire, but waits with asyncio.sleep so other requests on the loop keep running.
+        """
+        wait_time = self._take(cost)
+        while wait_time > 0:
+            await asyncio.sleep(wait_time)
+            wait_time = self._take(cost)
 
 
 class RIT_Client:
     """
     A class to interact with the STYNCLLC API.
     """
+    # How long a memoized GET response stays fresh, in seconds
+    CACHE_TTL = 0.05
+
     def __init__(self, api_key: str, port: int = 10001, base_url: str = 'http://localhost'):
         self.api_key = api_key
         self.port = port
@@ -19,29 +124,79 @@ class RIT_Client:
         self.host = f'{base_url}:{port}/v1'
         
         # Create a session with the API key
+        # Its keep-alive connection pool is shared by every synchronous request, so each call after the first skips the TCP handshake
         self.session = requests.Session()
         self.session.headers.update({'X-API-key': api_key})
+        self.session.trust_env = False  # The API is on localhost, skip the proxy environment lookup on every request
+        self.session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+        # Rate limiters, one bucket per security plus a 'global' bucket for endpoints that aren't tied to a security
+        # Each allows 100 requests per second with bursts of up to 100
+        self._buckets: dict[str, TokenBucket] = defaultdict(lambda: TokenBucket(rate=100, capacity=100))
 
-        # Rate limiter value
-        self.last_request_time = datetime.datetime.now()
+        # Conditional GET cache, url -> (etag, raw body, parsed body)
+        # Parsed bodies are shared between calls that hit the cache, so callers should treat them as read-only
+        self._etag_cache: dict[str, tuple[str, bytes, Any]] = {}
 
-    def rate_limit(self):
+        # Short lived response cache for endpoints polled several times per tick, endpoint -> (fetch time, response)
+        self._ttl_cache: dict[str, tuple[float, Any]] = {}
+
+    def rate_limit(self, key: str = 'global'):
         """
-        Each security has a rate limit of 100 requests per second
-        This rate limiter is lazy for now, and will always implement the rate limit of 100 requests per second
+        Each security has a rate limit of 100 requests per second, so each ticker gets its own bucket
+        Bursts are allowed up to the bucket capacity, so only sustained traffic above the limit is slowed down
+
+        Args:
+            key (str): The ticker the request is for, or 'global' for requests that aren't tied to a security.
         """
-        THRESHOLD = 100  # requests per second
+        self._buckets[key].acquire()
 
-        now = datetime.datetime.now()
+    async def rate_limit_async(self, key: str = 'global'):
+        """
+        Async version of rate_limit for the aiohttp path.
+        """
+        await self._buckets[key].acquire_async()
 
-        if now - self.last_request_time < datetime.timedelta(seconds= (1 / THRESHOLD)):
-            # If the time since the last request is less than the threshold, wait
-            wait_time = (1 / THRESHOLD) - (now - self.last_request_time).total_seconds()
-            if wait_time > 0:
-                time.sleep(wait_time)
-        
-        # Update the last request time
-        self.last_request_time = datetime.datetime.now()
+    @staticmethod
+    def rate_limit_key(params: dict = None) -> str:
+        """
+        Pick the rate limit bucket for a request from its parameters.
+        """
+        if params and params.get('ticker'):
+            return params['ticker']
+        return 'global'
+
+    def conditional_headers(self, cache_key: str) -> dict:
+        """
+        Build the If-None-Match header for a cached url, if the server gave us an ETag for it.
+        """
+        cached = self._etag_cache.get(cache_key)
+        if cached and cached[0]:
+            return {'If-None-Match': cached[0]}
+        return {}
+
+    def cached_decode(self, cache_key: str, status: int, etag: str, body: bytes):
+        """
+        Decode a GET response body, reusing the cached parse when nothing changed.
+        A 304 returns the cached value. If the server doesn't send ETags, an identical body also returns the cached value
+        so the JSON is only parsed when the data actually changed.
+
+        Args:
+            cache_key (str): The url (with query string) the response came from.
+            status (int): The HTTP status of the response.
+            etag (str): The ETag header of the response, if any.
+            body (bytes): The raw response body.
+
+        Returns:
+            The parsed JSON response.
+        """
+        cached = self._etag_cache.get(cache_key)
+        if cached is not None and (status == 304 or cached[1] == body):
+            return cached[2]
+
+        parsed = json_loads(body)
+        self._etag_cache[cache_key] = (etag, body, parsed)
+        return parsed
 
     def get(self, endpoint: str, params: dict = None):
         """
@@ -54,36 +209,71 @@ class RIT_Client:
         Returns:
             dict: The JSON response from the API.
         """
-        self.rate_limit()  # Call the rate limiter before making the request
+        self.rate_limit(self.rate_limit_key(params))  # Call the rate limiter before making the request
 
         url = f'{self.host}{endpoint}'
+        cache_key = f'{url}{self.query_generation(params)}'
         try:
-            response = self.session.get(url, params=params)
+            response = self.session.get(url, params=params, headers=self.conditional_headers(cache_key))
             response.raise_for_status()  # Raise an exception for HTTP errors
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return self.cached_decode(cache_key, response.status_code, response.headers.get('ETag'), response.content)
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"GET request failed: {e}")
             return None
 
-    def post(self, endpoint: str, data: dict = None):
+    def cached_get(self, endpoint: str, params: dict = None, ttl: float = None):
+        """
+        Send a GET request, reusing the response of the same request if it was made within the last `ttl` seconds.
+        The cache is cleared by any POST or DELETE, so state changed by our own orders is never served stale.
+
+        Args:
+            endpoint (str): The API endpoint to call (e.g., '/case').
+            params (dict, optional): Query parameters to include in the request.
+            ttl (float, optional): How long a response stays fresh. Defaults to CACHE_TTL.
+
+        Returns:
+            dict: The JSON response from the API.
+        """
+        ttl = self.CACHE_TTL if ttl is None else ttl
+        cache_key = f'{endpoint}{self.query_generation(params)}'
+
+        now = time.monotonic()
+        cached = self._ttl_cache.get(cache_key)
+        if cached is not None and now - cached[0] < ttl:
+            return cached[1]
+
+        response = self.get(endpoint, params)
+        if response is not None:
+            self._ttl_cache[cache_key] = (now, response)
+        return response
+
+    def invalidate_cache(self):
+        """
+        Drop all memoized GET responses. Called after every request that changes state on the exchange.
+        """
+        self._ttl_cache.clear()
+
+    def post(self, endpoint: str, data: dict = None, params: dict = None):
         """
         Send a POST request to the API.
 
         Args:
             endpoint (str): The API endpoint to call (e.g., '/orders').
             data (dict, optional): The JSON payload to include in the request.
+            params (dict, optional): Query parameters to include in the request.
 
         Returns:
             dict: The JSON response from the API.
         """
-        self.rate_limit()  # Call the rate limiter before making the request
+        self.rate_limit(self.rate_limit_key(params or data))  # Call the rate limiter before making the request
 
         url = f'{self.host}{endpoint}'
         try:
-            response = self.session.post(url, json=data)
+            response = self.session.post(url, json=data, params=params)
+            self.invalidate_cache()
             response.raise_for_status()  # Raise an exception for HTTP errors
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return json_loads(response.content)
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"POST request failed: {e}")
             return None
 
@@ -102,9 +292,10 @@ class RIT_Client:
         url = f'{self.host}{endpoint}'
         try:
             response = self.session.delete(url)
+            self.invalidate_cache()
             response.raise_for_status()  # Raise an exception for HTTP errors
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return json_loads(response.content)
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"DELETE request failed: {e}")
             return None
         
@@ -116,22 +307,30 @@ class RIT_Client:
             params (dict): A dictionary of query parameters.
 
         Returns:
-            str: A query string (e.g., '?key1=value1&key2=value2').
+            str: A url encoded query string (e.g., '?key1=value1&key2=value2').
         """
         if not params:
             return ''
         
-        # Filter out parameters with None values
-        relevant_params = {k: v for k, v in params.items() if v is not None}
-        
-        # Construct the query string
-        query = '&'.join(f'{k}={v}' for k, v in relevant_params.items())
-        return f'?{query}' if query else ''
+        # Filter out parameters with None values and let urlencode escape values like "Ticker='UB' AND Volume>0"
+        if frozenset(params) in MEMOIZED_QUERY_SHAPES:
+            try:
+                return encode_query(tuple(params.items()))
+            except TypeError:
+                # An unhashable value can't be a cache key, encode it directly
+                pass
+        return build_query(params.items())
 
 class Exchange_Client(RIT_Client):
     """
     A class to interact with the STYNCLLC API for exchange operations.
     """
+    # Query shapes for /commands/cancel, built once instead of on every cancel
+    _CANCEL_URL = '/commands/cancel'
+    _CANCEL_ALL_PARAMS = {'all': 1}
+    _CANCEL_DIR_TMPL = "Ticker='{ticker}' AND Volume{op}0"
+    _CANCEL_DIR_OPS = {'buy': '>', 'sell': '<'}
+
     def __init__(self, api_key: str, port: int = 10001, base_url: str = 'http://localhost'):
         super().__init__(api_key, port, base_url)
         self.api_key = api_key
@@ -144,24 +343,84 @@ class Exchange_Client(RIT_Client):
 
         self.tickers = ['GEM', 'UB', 'ETF']
 
+        # Persistent aiohttp session, created lazily on first async request and reused across ticks
+        self._session: aiohttp.ClientSession | None = None
+        self._session_loop = None
+
+        # Persistent event loop for the synchronous wrappers, so the session and its pooled sockets survive between polls
+        self._loop = new_event_loop()
+
+        # Set while the case is active, kept up to date by the status watcher thread, see start_status_watcher
+        self.active_event = threading.Event()
+        self._status_stop = threading.Event()
 
     # CASE ENDPOINT
     # Get tick from the json response of /case: from ['tick'] key of the json response
     # Get trading status from the json response of /case: from the ['status'] key of the json response
+    # Both read the same memoized /case response, so calling them back to back costs one request
     def get_tick(self):
-        response = self.get(self.case_url)
+        response = self.cached_get(self.case_url)
         if response:
             return response.get('tick')
         return None
     
-    def get_status(self):
-        response = self.get(self.case_url)
+    async def get_tick_async(self):
+        response = await self._async_get(self.case_url)
         if response:
-            status = response.get('status')
+            return response.get('tick')
+        return None
+
+    def get_status(self):
+        return self.parse_status(self.cached_get(self.case_url))
+
+    @staticmethod
+    def parse_status(case):
+        """
+        Read the trading status out of a /case response, e.g. the 'case' entry of a snapshot.
+
+        Returns:
+            bool: True if the case is active, None otherwise.
+        """
+        if case:
+            status = case.get('status')
             if status == 'ACTIVE':
                 return True
         return None
 
+    def start_status_watcher(self, interval: float = 0.5):
+        """
+        Poll the case status on a daemon thread and mirror it in active_event, so the trading loop can check it
+        without a request on its own critical path. The first poll happens before this returns. Stopped by stop_status_watcher.
+
+        Args:
+            interval (float): Seconds between status polls.
+
+        Returns:
+            threading.Event: active_event, set while the case is active.
+        """
+        self._status_stop.clear()
+        self._update_status()
+
+        thread = threading.Thread(target=self._status_loop, args=(interval,), name='rit-status', daemon=True)
+        thread.start()
+        return self.active_event
+
+    def _update_status(self):
+        if self.parse_status(self.get(self.case_url)):
+            self.active_event.set()
+        else:
+            self.active_event.clear()
+
+    def _status_loop(self, interval: float):
+        while not self._status_stop.wait(interval):
+            self._update_status()
+
+    def stop_status_watcher(self):
+        """
+        Stop the status watcher thread if one is running.
+        """
+        self._status_stop.set()
+
     # NEWS ENDPOINT
     # Some sort of parsing to get the respective data
     # What's important to get is the tick (which is it's own key), the ticker (which is in the headline), and the estimate (which is in the body)
@@ -171,6 +430,206 @@ class Exchange_Client(RIT_Client):
             return response.get('news')
         return None
 
+    async def _get_session(self):
+        """
+        Get the persistent aiohttp session, creating it on first use.
+        Reusing one session keeps the connection pool (and its keep-alive sockets) alive between ticks.
+
+        Returns:
+            aiohttp.ClientSession: The shared session for all async requests.
+
+        Raises:
+            RuntimeError: If the open session belongs to another event loop, it has to be closed with aclose on that loop first.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._session_loop is not loop:
+            # A session is bound to the loop it was created on, and replacing it here would leak its connector and sockets
+            raise RuntimeError('The aiohttp session is open on another event loop, await aclose() on that loop '
+                               '(or use "async with client") before using the client on a new one.')
+        if self._session is None or self._session.closed:
+            # The RIT API only speaks HTTP/1.1, so concurrent requests each hold one pooled keep-alive connection
+            # The host never changes, so its DNS resolution is cached for the life of the session
+            connector = aiohttp.TCPConnector(limit=32, limit_per_host=32, keepalive_timeout=75, ttl_dns_cache=None)
+            self._session = aiohttp.ClientSession(headers={'X-API-key': self.api_key}, connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    async def aclose(self):
+        """
+        Close the persistent aiohttp session if one was opened.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    def _run(self, coro):
+        """
+        Run a coroutine to completion on the client's persistent event loop.
+
+        Args:
+            coro (coroutine): The coroutine to run.
+
+        Returns:
+            The result of the coroutine.
+        """
+        return self._loop.run_until_complete(coro)
+
+    def close(self):
+        """
+        Close the persistent aiohttp session and the event loop that owns it.
+        """
+        self.stop_status_watcher()
+        if not self._loop.is_closed():
+            self._loop.run_until_complete(self.aclose())
+            self._loop.close()
+        self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def _async_get(self, endpoint: str, params: dict = None, session=None):
+        """
+        Send a GET request to the API over the persistent aiohttp session.
+
+        Args:
+            endpoint (str): The API endpoint to call (e.g., '/case').
+            params (dict, optional): Query parameters to include in the request.
+            session (aiohttp.ClientSession, optional): The session to use, defaults to the persistent one.
+
+        Returns:
+            dict: The JSON response from the API.
+        """
+        await self.rate_limit_async(self.rate_limit_key(params))
+
+        if session is None:
+            session = await self._get_session()
+        url = f'{self.host}{endpoint}{self.query_generation(params)}'
+
+        try:
+            async with session.get(url, headers=self.conditional_headers(url)) as response:
+                response.raise_for_status()
+                body = await response.read()
+                return self.cached_decode(url, response.status, response.headers.get('ETag'), body)
+        except (aiohttp.ClientError, ValueError) as e:
+            print(f"GET request failed: {e}")
+            return None
+
+    async def _async_post(self, endpoint: str, params: dict = None, session=None):
+        """
+        Send a POST request to the API over the persistent aiohttp session.
+        The API only reads the query string, so no body is sent.
+
+        Args:
+            endpoint (str): The API endpoint to call (e.g., '/orders').
+            params (dict, optional): Query parameters to include in the request.
+            session (aiohttp.ClientSession, optional): The session to use, defaults to the persistent one.
+
+        Returns:
+            dict: The JSON response from the API.
+        """
+        await self.rate_limit_async(self.rate_limit_key(params))
+
+        if session is None:
+            session = await self._get_session()
+        url = f'{self.host}{endpoint}{self.query_generation(params)}'
+
+        try:
+            async with session.post(url) as response:
+                self.invalidate_cache()
+                response.raise_for_status()
+                return json_loads(await response.read())
+        except (aiohttp.ClientError, ValueError) as e:
+            print(f"POST request failed: {e}")
+            return None
+
+    async def snapshot_async(self, limit: int = 200, news_since: int = None, include_case: bool = True):
+        """
+        Fetch the case, positions, orderbooks, resting orders and optionally new news concurrently,
+        so the start of a tick costs one round-trip instead of one per endpoint.
+
+        Args:
+            limit (int): The maximum number of orders to fetch per orderbook.
+            news_since (int, optional): Also fetch the news after this news id.
+            include_case (bool): Whether to fetch /case.
+
+        Returns:
+            dict: {'case': dict, 'positions': dict, 'orderbooks': dict, 'orders': list, 'news': list}, with only the requested keys,
+            plus 'captured_ns', the time.monotonic_ns() at which the responses arrived
+        """
+        requests_by_key = {
+            'positions': self.get_positions_async(),
+            'orderbooks': self.get_orderbooks_async(self.tickers, limit),
+            'orders': self.get_orders_async()
+        }
+        if include_case:
+            requests_by_key['case'] = self._async_get(self.case_url)
+        if news_since is not None:
+            requests_by_key['news'] = self._async_get(self.news_url, {'since': news_since})
+
+        results = await asyncio.gather(*requests_by_key.values())
+        snapshot = dict(zip(requests_by_key.keys(), results))
+
+        # When the data arrived, on the time.monotonic_ns clock, so callers can tell how stale it is when they act on it
+        snapshot['captured_ns'] = time.monotonic_ns()
+        return snapshot
+
+    async def send_orders_and_snapshot_async(self, orders: list, cancel_ids: list = None, limit: int = 200, news_since: int = None, include_case: bool = True):
+        """
+        Send a tick's orders and cancels while fetching the next tick's snapshot, so the order round-trip overlaps the market data one.
+        The resting orders in the snapshot may have been read before the sends landed, so they are brought up to date
+        from the create and cancel responses. Positions are only fetched again if an order filled on arrival,
+        and everything is fetched again if a send failed and its outcome is unknown.
+
+        Args:
+            orders (list): The order parameters for each order to create, see create_order.
+            cancel_ids (list, optional): The IDs of the orders to cancel, in one cancel request.
+            limit (int): The maximum number of orders to fetch per orderbook.
+            news_since (int, optional): Also fetch the news after this news id.
+            include_case (bool): Whether to fetch /case.
+
+        Returns:
+            dict: The snapshot, see snapshot_async.
+        """
+        (created, cancelled), snapshot = await asyncio.gather(
+            self._send_orders_and_cancel_async(orders, cancel_ids),
+            self.snapshot_async(limit, news_since, include_case)
+        )
+
+        # A failed send may or may not have landed, so only a fresh read can tell what is resting and what filled
+        if None in created or (cancel_ids and cancelled is None) or snapshot['orders'] is None:
+            snapshot['positions'], snapshot['orders'] = await asyncio.gather(self.get_positions_async(), self.get_orders_async())
+            return snapshot
+
+        # Drop the cancelled orders and add the new ones that are still resting, the snapshot's copy wins if it already has one
+        cancelled_ids = set(cancelled.get('cancelled_order_ids', ())) if cancelled else set()
+        resting = {order['order_id']: order for order in snapshot['orders'] if order['order_id'] not in cancelled_ids}
+        for order in created:
+            if order.get('status') == 'OPEN':
+                resting.setdefault(order['order_id'], order)
+        snapshot['orders'] = list(resting.values())
+
+        # Only an order that filled on arrival moves my positions before the next tick reads them
+        if any(order.get('status') == 'TRANSACTED' or order.get('quantity_filled') for order in created):
+            snapshot['positions'] = await self.get_positions_async()
+
+        return snapshot
+
+    def send_orders_and_snapshot(self, orders: list, cancel_ids: list = None, limit: int = 200, news_since: int = None, include_case: bool = True):
+        """
+        Synchronous wrapper around send_orders_and_snapshot_async using the persistent event loop.
+        """
+        return self._run(self.send_orders_and_snapshot_async(orders, cancel_ids, limit, news_since, include_case))
+
+    def snapshot(self, limit: int = 200, news_since: int = None, include_case: bool = True):
+        """
+        Synchronous wrapper around snapshot_async, run on the persistent event loop.
+        """
+        return self._run(self.snapshot_async(limit, news_since, include_case))
+
     # SECURITIES ENDPOINT
     # Uses the /orderbook endpoint to get the order book for a given security
     async def fetch_orderbook(self, session, ticker: str, limit: int = 200):
@@ -187,16 +646,7 @@ class Exchange_Client(RIT_Client):
         """
         endpoint = f'{self.securities_url}/book'
         params = {'ticker': ticker, 'limit': limit}
-        query_string = self.query_generation(params)
-        url = f'{self.host}{endpoint}{query_string}'
-
-        try:
-            async with session.get(url) as response:
-                response.raise_for_status()
-                return await response.json()
-        except aiohttp.ClientError as e:
-            print(f"Failed to fetch orderbook for {ticker}: {e}")
-            return None
+        return await self._async_get(endpoint, params, session)
 
     async def get_orderbooks_async(self, tickers: list, limit: int = 200):
         """
@@ -209,10 +659,10 @@ class Exchange_Client(RIT_Client):
         Returns:
             dict: A dictionary containing orderbook data for each security.
         """
-        async with aiohttp.ClientSession(headers={'X-API-key': self.api_key}) as session:
-            tasks = [self.fetch_orderbook(session, ticker, limit) for ticker in tickers]
-            results = await asyncio.gather(*tasks)
-            return {tickers[i]: results[i] for i in range(len(tickers))}
+        session = await self._get_session()
+        tasks = [self.fetch_orderbook(session, ticker, limit) for ticker in tickers]
+        results = await asyncio.gather(*tasks)
+        return {tickers[i]: results[i] for i in range(len(tickers))}
 
     def get_orderbooks(self, limit: int = 200):
         """
@@ -224,7 +674,45 @@ class Exchange_Client(RIT_Client):
         Returns:
             dict: A dictionary containing orderbook data for each security.
         """
-        return asyncio.run(self.get_orderbooks_async(self.tickers, limit))
+        return self._run(self.get_orderbooks_async(self.tickers, limit))
+
+    async def fetch_top_of_book(self, session, ticker: str):
+        """
+        Fetch only the best bid and ask order for a given security.
+        Asking the exchange for one level keeps the response tiny compared to the full depth orderbook.
+
+        Args:
+            session (aiohttp.ClientSession): The aiohttp session to use.
+            ticker (str): The ticker symbol of the security.
+
+        Returns:
+            dict: The orderbook for the security, limited to the best order on each side.
+        """
+        return await self.fetch_orderbook(session, ticker, limit=1)
+
+    async def get_nbbo_async(self, tickers: list = None):
+        """
+        Fetch the NBBO for multiple securities asynchronously, without pulling the full orderbooks.
+        Use this when only the top of book is needed, signal paths that need depth should keep using get_orderbooks.
+        The size is the size of the best order, which is not the full size at the best price if several orders are resting there.
+        My own orders are included.
+
+        Args:
+            tickers (list, optional): A list of ticker symbols, defaults to all traded tickers.
+
+        Returns:
+            dict: {'ticker': {'bids': [price, size] or None, 'asks': [price, size] or None}}
+        """
+        tickers = self.tickers if tickers is None else tickers
+        session = await self._get_session()
+        results = await asyncio.gather(*[self.fetch_top_of_book(session, ticker) for ticker in tickers])
+        return self.get_nbbo_book({tickers[i]: results[i] for i in range(len(tickers)) if results[i] is not None})
+
+    def get_nbbo(self):
+        """
+        Synchronous wrapper around get_nbbo_async for all traded tickers.
+        """
+        return self._run(self.get_nbbo_async())
     
     def get_contra_orderbooks(self, trader_id: str = 'user15'):
         """
@@ -245,14 +733,60 @@ class Exchange_Client(RIT_Client):
             asks = data.get('asks', [])
             
             # Filter bids and asks based on trader_id
-            filtered_bids = [bid for bid in bids if bid.get('trader_id') != trader_id] if trader_id else bids
-            filtered_asks = [ask for ask in asks if ask.get('trader_id') != trader_id] if trader_id else asks
-            
-            filtered_orderbook[ticker]['bids'] = filtered_bids
-            filtered_orderbook[ticker]['asks'] = filtered_asks
+            filtered_orderbook[ticker]['bids'] = self.remove_trader_orders(bids, trader_id)
+            filtered_orderbook[ticker]['asks'] = self.remove_trader_orders(asks, trader_id)
 
         return filtered_orderbook
+
+    @staticmethod
+    def remove_trader_orders(levels, trader_id):
+        """
+        Removes one trader's orders from one side of an orderbook.
+        Usually only a couple of levels are ours, so the side is only copied when it actually contains one of our orders.
+
+        Args:
+            levels (list): The orders on one side of the book.
+            trader_id (str): The user id of the trader to remove.
+
+        Returns:
+            list: The orders that don't belong to trader_id, which is the original list if there were none.
+        """
+        if not trader_id or not any(level['trader_id'] == trader_id for level in levels):
+            return levels
+        return [level for level in levels if level['trader_id'] != trader_id]
     
+    @staticmethod
+    def consolidate_side(levels, exclude_trader_id: str = None, max_depth: int = None):
+        """
+        Merges one side of an orderbook into [price, remaining size] levels in a single pass.
+        The exchange sends each side already sorted best price first, so orders at the same price are next to each other
+        and can be merged into the previous level without a dictionary or a re-sort.
+
+        Args:
+            levels (list): The orders on one side of the book, best price first.
+            exclude_trader_id (str, optional): Skip the orders of this trader while merging.
+            max_depth (int, optional): Stop after this many price levels, the rest of the side isn't walked.
+
+        Returns:
+            list: [[price, size], ...] best price first.
+        """
+        consolidated = []
+        last_price = None
+        for level in levels:
+            if exclude_trader_id is not None and level['trader_id'] == exclude_trader_id:
+                continue
+            price = level['price']
+            quantity = level['quantity'] - level.get('quantity_filled', 0)
+            if price == last_price:
+                consolidated[-1][1] += quantity
+            else:
+                if len(consolidated) == max_depth:
+                    break
+                consolidated.append([price, quantity])
+                last_price = price
+
+        return consolidated
+
     def get_consolidated_orderbook(self, orderbook):
         """
         This function takes an orderbook and turns it into price, size notation only
@@ -266,37 +800,37 @@ class Exchange_Client(RIT_Client):
         consolidated_orderbook = {}
 
         for ticker, data in orderbook.items():
-            bids = data.get('bids', [])
-            asks = data.get('asks', [])
-
-            # Consolidate bids
-            consolidated_bids = {}
-            for bid in bids:
-                price = bid['price']
-                quantity = bid['quantity'] - bid.get('quantity_filled', 0)
-                if price in consolidated_bids:
-                    consolidated_bids[price] += quantity
-                else:
-                    consolidated_bids[price] = quantity
-
-            # Consolidate asks
-            consolidated_asks = {}
-            for ask in asks:
-                price = ask['price']
-                quantity = ask['quantity'] - ask.get('quantity_filled', 0)
-                if price in consolidated_asks:
-                    consolidated_asks[price] += quantity
-                else:
-                    consolidated_asks[price] = quantity
-
-            # Convert consolidated bids and asks back to list format
             consolidated_orderbook[ticker] = {
-                'bids': [[price, quantity] for price, quantity in sorted(consolidated_bids.items(), reverse=True)],
-                'asks': [[price, quantity] for price, quantity in sorted(consolidated_asks.items())]
+                'bids': self.consolidate_side(data.get('bids', [])),
+                'asks': self.consolidate_side(data.get('asks', []))
             }
 
         return consolidated_orderbook
     
+    def get_consolidated_contra_orderbook(self, trader_id: str = 'user15', orderbook: dict = None):
+        """
+        Same result as get_consolidated_orderbook(get_contra_orderbooks(trader_id)), but each side of the raw book is walked once:
+        my orders are skipped while the levels are merged instead of filtering into a copy first.
+
+        Args:
+            trader_id (str): The user id of this trader to filter out of the orderbook
+            orderbook (dict, optional): An already fetched orderbook, fetched from the exchange if not given.
+
+        Returns:
+            dict: {'ticker': {'bids': [[price, size], ...], 'asks': [[price, size], ...]}}
+        """
+        if orderbook is None:
+            orderbook = self.get_orderbooks()
+
+        consolidated_orderbook = {}
+        for ticker, data in orderbook.items():
+            consolidated_orderbook[ticker] = {
+                'bids': self.consolidate_side(data.get('bids', []), trader_id),
+                'asks': self.consolidate_side(data.get('asks', []), trader_id)
+            }
+
+        return consolidated_orderbook
+
     def get_nbbo_book(self, orderbook):
         """
         Get the NBBO (National Best Bid and Offer) from the orderbook.
@@ -331,13 +865,31 @@ class Exchange_Client(RIT_Client):
         Returns:
             dict: The position data for the given security.
         """
-        positions = {}
-
         endpoint = self.securities_url
 
         # Make the GET request to fetch the list of securitiy information
         response = self.get(endpoint)
-        for dictr in response:
+        return self.parse_positions(response)
+
+    async def get_positions_async(self):
+        """
+        Async version of get_positions.
+        """
+        response = await self._async_get(self.securities_url)
+        return self.parse_positions(response)
+
+    def parse_positions(self, securities):
+        """
+        Pull the positions for the traded tickers out of the /securities response.
+
+        Args:
+            securities (list): The list of security information from /securities.
+
+        Returns:
+            dict: The position for each ticker.
+        """
+        positions = {}
+        for dictr in securities:
             ticker = dictr.get('ticker')
             position = dictr.get('position', 0)
             if ticker in self.tickers:
@@ -356,11 +908,7 @@ class Exchange_Client(RIT_Client):
         Returns:
             int: The (gem position + ub position) - etf position
         """
-        gem_position = positions.get('GEM', 0)
-        ub_position = positions.get('UB', 0)
-        etf_position = positions.get('ETF', 0)
-
-        return (gem_position + ub_position) - etf_position
+        return (positions.get('GEM', 0) + positions.get('UB', 0)) - positions.get('ETF', 0)
     
     def get_gross_position(self, positions):
         """
@@ -372,10 +920,7 @@ class Exchange_Client(RIT_Client):
         Returns:
             int: The gross position, sum(abs(position)) for all securities.
         """
-        gross_position = 0
-        for position in positions.values():
-            gross_position += abs(position)
-        return gross_position
+        return abs(positions.get('GEM', 0)) + abs(positions.get('UB', 0)) + abs(positions.get('ETF', 0))
 
     # ORDERS ENDPOINT
     # Has the get, post, and delete methods uses a get_orders, create_orders, and delete method to get, create, and delete orders respectively
@@ -388,7 +933,13 @@ class Exchange_Client(RIT_Client):
             list: List of dictionaries containing order information.
         """
         endpoint = self.orders_url
-        return self.get(endpoint)
+        return self.cached_get(endpoint)
+
+    async def get_orders_async(self):
+        """
+        Async version of get_orders.
+        """
+        return await self._async_get(self.orders_url)
     
     def get_order(self, order_id):
         """
@@ -400,7 +951,7 @@ class Exchange_Client(RIT_Client):
         Returns:
             dict: The order data for the given ID.
         """
-        endpoint = f'{self.orders_url}/{order_id}'
+        endpoint = order_endpoint(self.orders_url, order_id)
         return self.get(endpoint)
 
     def get_quotes(self):
@@ -408,24 +959,30 @@ class Exchange_Client(RIT_Client):
         Fetch all the quotes for the trader
 
         Returns:
-            dict: a ticker keyed dictionary with ['bids']: [price, size], ['asks']: [price, size] notation
+            dict: a ticker keyed dictionary with ['bids']: [(price, size, order_id), ...], ['asks']: [(price, size, order_id), ...] notation
+        """
+        return self.parse_quotes(self.get_orders())
+
+    def parse_quotes(self, orders):
+        """
+        Sort the resting orders from /orders into quotes by ticker and side
+
+        Args:
+            orders (list): The resting orders from /orders.
+
+        Returns:
+            dict: a ticker keyed dictionary with ['bids']: [(price, size, order_id), ...], ['asks']: [(price, size, order_id), ...] notation
         """
         quotes = {'GEM': {'bids': [], 'asks': []}, 'UB': {'bids': [], 'asks': []}, 'ETF': {'bids': [], 'asks': []}}
         
-        orders = self.get_orders()
+        get_fields = itemgetter('ticker', 'price', 'quantity', 'quantity_filled', 'action', 'order_id')
         
         for order in orders:
-            ticker = order.get('ticker')
-            price = order.get('price')
-            size = order.get('quantity') - order.get('quantity_filled', 0)
+            ticker, price, quantity, quantity_filled, action, order_id = get_fields(order)
             
             # Determine if it's a bid or ask and add to the respective list
-            if order.get('action') == 'BUY':
-                order_id = order.get('order_id')
-                quotes[ticker]['bids'].append({'price': price, 'size': size, 'order_id': order_id})
-            elif order.get('action') == 'SELL':
-                order_id = order.get('order_id')
-                quotes[ticker]['asks'].append({'price': price, 'size': size, 'order_id': order_id})
+            side = 'bids' if action == 'BUY' else 'asks'
+            quotes[ticker][side].append((price, quantity - (quantity_filled or 0), order_id))
 
         return quotes
     
@@ -443,21 +1000,65 @@ class Exchange_Client(RIT_Client):
         Returns:
             dict: The response data from the create operation.
         """
-        endpoint = self.orders_url
-        query_string = self.query_generation(params)
-        url = f'{self.host}{endpoint}{query_string}'
-        # Make the POST request to create the order
+        self.rate_limit(self.rate_limit_key(params))
+
+        url = f'{self.host}{self.orders_url}'
+        # Make the POST request to create the order, the API only reads the query string so no JSON body is sent
         try:
-            response = self.session.post(url, json=params)
+            response = self.session.post(url, params=params)
+            self.invalidate_cache()
             response.raise_for_status()  # Raise an exception for HTTP errors
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return json_loads(response.content)
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"POST request failed: {e}")
             return None
     
+    async def create_order_async(self, params: dict):
+        """
+        Async version of create_order.
+        """
+        return await self._async_post(self.orders_url, params)
+
+    async def send_orders_async(self, orders: list, cancel_ids: list = None):
+        """
+        Create several orders and optionally cancel others concurrently, so the batch costs one round-trip instead of one per order.
+
+        Args:
+            orders (list): The order parameters for each order to create, see create_order.
+            cancel_ids (list, optional): The IDs of the orders to cancel, in one cancel request.
+
+        Returns:
+            list: The response data from each create operation, in the order given.
+        """
+        created, _ = await self._send_orders_and_cancel_async(orders, cancel_ids)
+        return created
+
+    async def _send_orders_and_cancel_async(self, orders: list, cancel_ids: list = None):
+        """
+        Create the orders and send the cancel concurrently, see send_orders_async.
+
+        Returns:
+            tuple: The response data from each create operation in the order given, and the cancel response, None if there was no cancel.
+        """
+        requests_to_send = [self.create_order_async(order) for order in orders]
+        if cancel_ids:
+            requests_to_send.append(self._async_post(self._CANCEL_URL, self._cancel_ids_params(cancel_ids)))
+
+        results = await asyncio.gather(*requests_to_send)
+        return results[:len(orders)], results[len(orders)] if cancel_ids else None
+
+    def send_orders(self, orders: list, cancel_ids: list = None):
+        """
+        Synchronous wrapper around send_orders_async using the persistent event loop.
+        """
+        if not orders and not cancel_ids:
+            return []
+        return self._run(self.send_orders_async(orders, cancel_ids))
+
     def cancel_order(self, order_id):
         """
         Delete a specific order by its ID.
+        Only use this for a single order, cancel_orders cancels several orders in one request.
 
         Args:
             order_id (str): The ID of the order to delete.
@@ -465,9 +1066,16 @@ class Exchange_Client(RIT_Client):
         Returns:
             dict: The response data from the delete operation.
         """
-        endpoint = f'{self.orders_url}/{order_id}'
+        endpoint = order_endpoint(self.orders_url, order_id)
         return self.delete(endpoint)
     
+    @staticmethod
+    def _cancel_ids_params(order_ids) -> dict:
+        """
+        Build the /commands/cancel query that cancels the given orders by ID.
+        """
+        return {'ids': ','.join(map(str, order_ids))}
+
     def cancel_all_orders(self, all_orders: bool = False, ticker: str = None, direction: str = None, order_ids: list = None):
         """
         Cancel open orders based on the specified parameters.
@@ -476,45 +1084,54 @@ class Exchange_Client(RIT_Client):
             all_orders (bool, optional): Set to True to cancel all open orders. Defaults to False.
             ticker (str, optional): Cancel all open orders for a specific security. Defaults to None.
             direction (str, optional): Specify 'buy' or 'sell' to cancel only buy or sell orders for the given ticker. Defaults to None.
+            order_ids (list, optional): Cancel these specific orders by ID. Defaults to None.
 
         The documentation allows for more specific query paramaters but I only included the ones relevant for this program
 
         Returns:
             dict: The response data from the cancel operation.
         """
+        direction_l = direction.lower() if direction else None
+
         # Validate input
         if all_orders and (ticker or direction) and (order_ids is None):
             raise ValueError("Cannot specify 'all_orders' with 'ticker' or 'direction' or 'order_id.")
-        if direction and direction.lower() not in ['buy', 'sell']:
+        if direction_l and direction_l not in self._CANCEL_DIR_OPS:
             raise ValueError("Invalid direction. Must be 'buy' or 'sell'.")
 
         # Construct query parameters
         if all_orders:
-            params = {'all': 1}
+            params = self._CANCEL_ALL_PARAMS
         elif ticker:
-            if direction:
-                # Construct query for ticker and direction
-                volume = '<0' if direction.lower() == 'sell' else '>0'
-                query = f"Ticker='{ticker}' AND Volume{volume}"
-                params = {'query': query}
+            if direction_l:
+                # Fill the ticker and direction into the query template
+                params = {'query': self._CANCEL_DIR_TMPL.format(ticker=ticker, op=self._CANCEL_DIR_OPS[direction_l])}
             else:
                 # Cancel all orders for the ticker
                 params = {'ticker': ticker}
         elif order_ids: 
             # Cancel specific orders by ID
-            params = {'ids': ','.join(str(order_id) for order_id in order_ids)}
+            params = self._cancel_ids_params(order_ids)
         else:
             raise ValueError("Must specify either 'all_orders', 'ticker', or 'order_ids'.")
-        
-        # Generate the query string
-        query_string = self.query_generation(params)
-
-        # Construct the endpoint
-        endpoint = f'/commands/cancel{query_string}'
 
-        # Send the POST request
-        return self.post(endpoint)
+        # Send the POST request, requests encodes the query parameters
+        return self.post(self._CANCEL_URL, params=params)
     
+    def cancel_orders(self, order_ids: list):
+        """
+        Cancel several orders by ID with a single request instead of one DELETE per order.
+
+        Args:
+            order_ids (list): The IDs of the orders to cancel.
+
+        Returns:
+            dict: The response data from the cancel operation, None if there was nothing to cancel.
+        """
+        if not order_ids:
+            return None
+        return self.cancel_all_orders(order_ids=order_ids)
+
     def get_fills(self):
         """
         Fetch all the fills for the trader
@@ -522,17 +1139,69 @@ class Exchange_Client(RIT_Client):
         Returns:
             list: List of dictionaries containing fill information.
         """
-        query_string = self.query_generation({'status': 'TRANSACTED'})
-        endpoint = f'{self.orders_url}{query_string}'
-        return self.get(endpoint)
+        return self.cached_get(self.orders_url, {'status': 'TRANSACTED'})
     
 
 
-exchange_client = Exchange_Client(API_KEY)
 
-base_url = 'http://localhost:10001/v1'
-mock_endpoint = '/securities'
-mock_url = 'http://localhost:10001/v1/securities/book/UB'
-response = requests.get(base_url + mock_endpoint, headers={'X-API-key': API_KEY})
-#print(response.json())
-# print(exchange_client.get_consolidated_orderbook(exchange_client.get_contra_orderbooks()))
+class BookManager:
+    """
+    Keeps the consolidated contra orderbook of every ticker between ticks and only reconsolidates the tickers whose book changed.
+    An unchanged book comes back from the client's response cache as the same parsed object, so an identity check detects it
+    without comparing the levels.
+    """
+    def __init__(self, exchange_client: Exchange_Client, trader_id: str = 'user15', max_depth: int = None):
+        self.exchange_client = exchange_client
+        self.trader_id = trader_id
+
+        # Price levels kept per side, None keeps the whole book
+        self.max_depth = max_depth
+
+        # ticker -> (raw orderbook it was built from, consolidated contra book)
+        # Holding the raw book keeps the identity check valid, its id can't be reused while it is referenced here
+        self._books: dict[str, tuple[dict, dict]] = {}
+
+    def update(self, orderbook: dict):
+        """
+        Bring the consolidated contra orderbook up to date with a freshly fetched orderbook.
+
+        Args:
+            orderbook (dict): The raw orderbook of each ticker, e.g. the 'orderbooks' entry of a snapshot.
+
+        Returns:
+            dict: {'ticker': {'bids': [[price, size], ...], 'asks': [[price, size], ...]}}, shared between ticks so callers should treat it as read-only
+        """
+        consolidate_side = self.exchange_client.consolidate_side
+        consolidated_orderbook = {}
+
+        for ticker, data in orderbook.items():
+            cached = self._books.get(ticker)
+            if cached is None or cached[0] is not data:
+                data = data or {}
+                cached = (data, {
+                    'bids': consolidate_side(data.get('bids', []), self.trader_id, self.max_depth),
+                    'asks': consolidate_side(data.get('asks', []), self.trader_id, self.max_depth)
+                })
+                self._books[ticker] = cached
+            consolidated_orderbook[ticker] = cached[1]
+
+        return consolidated_orderbook
+
+def get_default_client(api_key_path: str = 'api_key.txt'):
+    """
+    Create an Exchange_Client using the API key stored in api_key_path.
+    """
+    return Exchange_Client(load_api_key(api_key_path))
+
+
+if __name__ == '__main__':
+    API_KEY = load_api_key()
+    exchange_client = Exchange_Client(API_KEY)
+
+    base_url = 'http://localhost:10001/v1'
+    mock_endpoint = '/securities'
+    mock_url = 'http://localhost:10001/v1/securities/book/UB'
+    response = requests.get(base_url + mock_endpoint, headers={'X-API-key': API_KEY})
+    #print(response.json())
+    # print(exchange_client.get_consolidated_orderbook(exchange_client.get_contra_orderbooks()))
+    exchange_client.close()
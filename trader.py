@@ -1,47 +1,272 @@
 import requests
+import gc
+import json
+import os
+import re
+import statistics
+import threading
 import time
-from clients import Exchange_Client
+from bisect import bisect_right
+from collections import defaultdict, deque
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from operator import itemgetter
+from requests.adapters import HTTPAdapter
+from clients import BookManager, Exchange_Client, json_loads
 
 with open('api_key.txt', 'r') as f:
     API_KEY = f.read().strip()
 
-    
+# Shared keep-alive session for the news polls, so every poll reuses the same localhost connection
+_SESSION = requests.Session()
+_SESSION.headers['X-API-key'] = API_KEY
+_SESSION.trust_env = False  # The API is on localhost, skip the proxy environment lookup on every request
+_SESSION.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+
+# Fixed ticker order, per-ticker state is kept in lists and tuples indexed in this order
+TICKERS = ('GEM', 'UB', 'ETF')
+
 POSITION_LIMITS = {
     'GEM': 33000,
     'UB': 17500,
     'ETF': 33000 + 17500
 }
 
+# The same limits in TICKERS order, for the positional quote math
+POSITION_LIMITS_VECTOR = tuple(POSITION_LIMITS[ticker] for ticker in TICKERS)
+
+# Index of each ticker in TICKERS, for going from a ticker string to the positional state
+TICKER_INDEX = {ticker: index for index, ticker in enumerate(TICKERS)}
+
+# Limit on the sum of the absolute positions across all tickers
+GROSS_POSITION_LIMIT = 100000
+
+# Price levels of each side of the contra book that are consolidated, the quoter only needs the top level
+# and the hitter only sweeps the first few levels past the estimates
+HITTER_MAX_DEPTH = 20
+
+# The hitter's 5,000 share market orders, built once at import and shared read-only instead of allocated on every sweep
+MARKET_SLICE_ORDERS = {
+    (ticker, action): {'ticker': ticker, 'type': 'MARKET', 'quantity': 5000, 'action': action}
+    for ticker in TICKERS for action in ('BUY', 'SELL')
+}
+
+# Quote prices are worked out in integer cents
+COMMISSION_CENTS = 2  # 2 cents per share
+TICK_CENTS = 1
+
+# Best bid and ask assumed when a side of the contra book is empty, in cents
+QUOTE_DEFAULTS_CENTS = {
+    'GEM': (2000, 3000),
+    'UB': (4000, 6000),
+    'ETF': (6000, 9000)
+}
+
+# Private information news, the ticker is named in the headline and the estimate is the last dollar amount in the body
+_NEWS_TICKER_RE = re.compile(r'\b(GEM|UB)\b')
+_NEWS_ESTIMATE_RE = re.compile(r'\$(\d+(?:\.\d+)?)')
+
+# Port to serve the tick loop's latency percentiles on, None to not serve them
+LATENCY_STATS_PORT = None
+
+# CPU core to pin the trading thread to, None to leave it to the scheduler
+# Pinning only removes scheduling jitter if the core is kept free of other work, e.g. by booting with isolcpus=<core> nohz_full=<core>
+TRADER_CORE = None
+
+# SCHED_FIFO priority (1-99) for the trading thread, None to keep the normal scheduler, needs root or CAP_SYS_NICE
+TRADER_REALTIME_PRIORITY = None
+
+# Oldest a snapshot's orderbooks can be for the hitter to trade on them, in nanoseconds
+# Sweeping an old book risks hitting prices that already moved, the quoter still requotes on it
+MAX_BOOK_AGE_NS = 250_000_000
+
+# Seconds to wait before polling again when nothing changed in the last tick
+IDLE_POLL_INTERVAL = 0.05
+
+# Orderbook level accessors, levels are [price, size]
+_level_price = itemgetter(0)
+_level_size = itemgetter(1)
+
+
+def _negated_price(level):
+    return -level[0]
+
+
+class Quotes:
+    """
+    A set of two sided quotes for all tickers, stored as one list per field indexed in TICKERS order
+    Prices are in integer cents
+    """
+    __slots__ = ('bid_prices', 'bid_sizes', 'ask_prices', 'ask_sizes')
+
+    def __init__(self, bid_prices, bid_sizes, ask_prices, ask_sizes):
+        self.bid_prices = bid_prices
+        self.bid_sizes = bid_sizes
+        self.ask_prices = ask_prices
+        self.ask_sizes = ask_sizes
+
+
+class TopOfBook:
+    """
+    The best bid and ask of each ticker in the contra orderbook, stored as one list per field indexed in TICKERS order
+    Extracted once per tick and shared by the quoter and the hitter, prices are in integer cents
+    """
+    __slots__ = ('bid_prices', 'bid_sizes', 'ask_prices', 'ask_sizes')
+
+    def __init__(self, consolidated_contra_book):
+        """
+        Args:
+            consolidated_contra_book (dict): The orderbook with my quotes removed so I won't self-trade with orders consolidated by price and size
+            It is in the format of {'ticker': {'bids': [[price, size], ...], 'asks': [[price, size], ...]}}
+            An empty side falls back to the edge of the ticker's price range with size 0
+        """
+        self.bid_prices, self.bid_sizes, self.ask_prices, self.ask_sizes = [], [], [], []
+
+        # Prices are positive, so adding 0.5 and truncating rounds to the nearest cent without a round() call
+
+        for ticker in TICKERS:
+            default_bid, default_ask = QUOTE_DEFAULTS_CENTS[ticker]
+            bids = consolidated_contra_book[ticker]['bids']
+            asks = consolidated_contra_book[ticker]['asks']
+
+            self.bid_prices.append(int(bids[0][0] * 100 + 0.5) if bids else default_bid)
+            self.bid_sizes.append(bids[0][1] if bids else 0)
+            self.ask_prices.append(int(asks[0][0] * 100 + 0.5) if asks else default_ask)
+            self.ask_sizes.append(asks[0][1] if asks else 0)
+
+
+class LatencyTracker:
+    """
+    Keeps the most recent latencies of each stage of the tick loop in microseconds and reports rolling percentiles,
+    to find where the time per tick goes
+    """
+    def __init__(self, window=1024):
+        self.window = window
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+
+    def record(self, metric, microseconds):
+        """
+        Records one latency sample, only the last window samples of each metric are kept
+        """
+        self.samples[metric].append(microseconds)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: A dictionary with [metric] = {'count', 'p50', 'p95', 'max'} in microseconds over the samples kept
+        """
+        stats = {}
+        for metric, samples in list(self.samples.items()):
+            samples = list(samples)
+            if len(samples) < 2:
+                continue
+            percentiles = statistics.quantiles(samples, n=20)
+            stats[metric] = {'count': len(samples), 'p50': percentiles[9], 'p95': percentiles[18], 'max': max(samples)}
+
+        return stats
+
+    def serve(self, port):
+        """
+        Serves get_stats as JSON on localhost:port from a daemon thread, for watching the latencies while the trader runs
+        """
+        tracker = self
+
+        class StatsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(tracker.get_stats()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('localhost', port), StatsHandler)
+        threading.Thread(target=server.serve_forever, name='latency-stats', daemon=True).start()
+        return server
+
+
+class PositionState:
+    """
+    My position in each ticker with its limit and skew, stored as one list per field indexed in TICKERS order
+    Built once per tick from the positions by ticker and shared by the hitter and the quoter, so neither looks positions up by ticker string
+    """
+    __slots__ = ('positions', 'limits', 'skews', 'gross')
+
+    def __init__(self, positions):
+        """
+        Args:
+            positions (dict): My positions by ticker, from exchange_client.get_positions or a snapshot
+        """
+        self.positions = [positions[ticker] for ticker in TICKERS]
+        self.limits = POSITION_LIMITS_VECTOR
+
+        # Position relative to its limit on a -1 to 1 scale, ((position + limit) / (2 * limit) - 0.5) * 2 simplifies to position / limit
+        self.skews = [position / limit for position, limit in zip(self.positions, self.limits)]
+
+        # Sum of the absolute positions, checked against GROSS_POSITION_LIMIT
+        self.gross = sum(abs(position) for position in self.positions)
+
+
 class News:
     """
     A class to represent news data and handle news data to provide estimates for the GEM, UB, and ETF markets
     """
     def __init__(self):
         self.latest_news = []
-        self.news_length = 1
+        self.news_length = 0
         self.estimates = {'GEM': [20, 30], 'UB': [40, 60], 'ETF': [60, 90]}
+        self.quote_caps = self.calculate_quote_caps(self.estimates)
         self.new_news = False
 
+        # Highest news id seen so far, only news after it is requested from the API
+        self.last_news_id = 0
+
+        # Running estimate intervals, starting at the full range of each ticker, and the news ids already folded into them
+        self._intervals = {'GEM': [20.0, 30.0], 'UB': [40.0, 60.0]}
+        self._processed_ids = set()
+
+        # Parsed (time, ticker, estimate) of each news item by news id, news items never change once published
+        self._parsed_news = {}
+
         self.full_process_news()
 
     def get_latest_news(self):
         """
-        Returns the latest news data from the API as a list of all the news items
+        Returns the latest news data from the API as a list of all the news items, newest first
+        Only the news after the last seen news id is downloaded, and new_news is set when any arrived
         """
-        response = requests.get(f'http://localhost:10001/v1/news', headers={'X-API-key': API_KEY})
+        response = _SESSION.get('http://localhost:10001/v1/news', params={'since': self.last_news_id})
         if response.status_code == 200:
-            self.latest_news = response.json()
-            if len(self.latest_news) != self.news_length:
-                self.new_news = True
-                self.news_length = len(self.latest_news)
-            else:
-                self.new_news = False
-
-            return self.latest_news
+            return self.ingest_news(json_loads(response.content))
         else:
             print("Failed to fetch news data")
+            self.new_news = False
             return None       
 
+    def ingest_news(self, new_items):
+        """
+        Adds the news that arrived since the last poll to latest_news and sets new_news if there was any
+
+        Args:
+            new_items (list): The news items after last_news_id, newest first
+
+        Returns:
+            list: All the news items, newest first
+        """
+        if new_items:
+            self.new_news = True
+            self.latest_news = new_items + self.latest_news
+            self.news_length = len(self.latest_news)
+            self.last_news_id = max(news['news_id'] for news in new_items)
+        else:
+            self.new_news = False
+
+        return self.latest_news
+
     def parse_news_item(self, news_item):
         """
         Parses a single news item to extract and reutrn 
@@ -55,29 +280,22 @@ class News:
             
         Returns: (time, ticker, estimate)
         """
+        news_id = news_item.get('news_id')
+        if news_id in self._parsed_news:
+            return self._parsed_news[news_id]
+
         # Extract the ticker from the headline
-        headline = news_item.get('headline', '')
-        if 'GEM' in headline:
-            ticker = 'GEM'
-        elif 'UB' in headline:
-            ticker = 'UB'
-        else:
-            ticker = None
-
-        # Extract the estimate from the body
-        body = news_item.get('body', '')
-        if len(body) > 0:
-            estimate = body.split('$')[-1].strip()
-            if estimate:
-                estimate = float(estimate.split()[0])
-            else:
-                estimate = None
-        else:
-            estimate = None
+        ticker_match = _NEWS_TICKER_RE.search(news_item.get('headline', ''))
+        ticker = ticker_match.group(1) if ticker_match else None
+
+        # Extract the estimate from the body, it is the last dollar amount
+        estimate_matches = _NEWS_ESTIMATE_RE.findall(news_item.get('body', ''))
+        estimate = float(estimate_matches[-1]) if estimate_matches else None
 
         tick = news_item.get('tick')
         time_ = tick + 1 # # Adding 1 to the tick to get the time in seconds
 
+        self._parsed_news[news_id] = (time_, ticker, estimate)
         return time_, ticker, estimate
     
     def calculate_estimate_interval(self, time, estimate):
@@ -85,13 +303,10 @@ class News:
         Calculates the estimate interval for the given time, ticker, and estimate using the formula from the documentation
         Formula: estimate = actual + X(300 - time) / 50 where X is uniform[-1, 1]
         """
-        estimate_interval = []
         coefficient = (300 - time) / 50
-        minimum = estimate - coefficient
-        maximum = estimate + coefficient
-        estimate_interval = [round(minimum, 2), round(maximum, 2)]
 
-        return estimate_interval
+        # Not rounded here, rounding is monotonic so update_estimates rounds the combined bounds once instead
+        return [estimate - coefficient, estimate + coefficient]
     
     def calculate_expected_values(self, estimates):
         """
@@ -105,48 +320,34 @@ class News:
     
     def process_news(self, news_data):
         """
-        Takes large news data -> sorts into ticker-specific news -> builds estimates based on the documentation function
-        """
-        geb_estimates = []
-        ub_estimates = []
+        Takes large news data -> sorts into ticker-specific news -> folds the estimates into the running intervals for each ticker
+        The interval takes the maximum of the minimums and the minimum of the maximums, which doesn't depend on order,
+        so only news that hasn't been processed yet is parsed and folded in
 
+        Returns:
+            dict: The running [minimum, maximum] interval for GEM and UB, unrounded
+        """
         for news in news_data:
+            news_id = news['news_id']
+            if news_id in self._processed_ids:
+                continue
+            self._processed_ids.add(news_id)
+
             # First always pass over the news data with news_id of 1 or 12 since this is the introductory and ending news without any estimates
-            if news['news_id'] == 1 or news['news_id'] == 12:
+            if news_id == 1 or news_id == 12:
                 continue
 
             # Parse the news item to extract relevant information
             time_, ticker, estimate = self.parse_news_item(news)
-            estimate_interval = self.calculate_estimate_interval(time_, estimate)
-            if ticker == 'GEM':
-                geb_estimates.append(estimate_interval)
-            elif ticker == 'UB':
-                ub_estimates.append(estimate_interval)
-            else:
+            if ticker not in self._intervals or estimate is None:
                 continue
 
-        return geb_estimates, ub_estimates
-    
-    def get_processed_interval(self, geb_estimates, ub_estimates):
-        """
-        Takes the estimates and returns the processed intervals for each ticker
-        The processed interval takes the maximum of the minimums and the minimum of the maximums for each ticker
-        """
-        if geb_estimates == []:
-            geb_minimum = 20
-            geb_maximum = 30
-        else:
-            geb_minimum = max(max([estimate[0] for estimate in geb_estimates]), 20)
-            geb_maximum = min(min([estimate[1] for estimate in geb_estimates]), 30)
-
-        if ub_estimates == []:
-            ub_minimum = 40
-            ub_maximum = 60
-        else:
-            ub_minimum = max(max([estimate[0] for estimate in ub_estimates]), 40)
-            ub_maximum = min(min([estimate[1] for estimate in ub_estimates]), 60)
+            minimum, maximum = self.calculate_estimate_interval(time_, estimate)
+            interval = self._intervals[ticker]
+            interval[0] = max(interval[0], minimum)
+            interval[1] = min(interval[1], maximum)
 
-        return [geb_minimum, geb_maximum], [ub_minimum, ub_maximum]
+        return self._intervals
     
     def full_process_news(self):
         """
@@ -156,23 +357,72 @@ class News:
             dict: A dictionary with the estimates for each ticker with key as the ticker and value as the estimate interval as a list
         """
         news_data = self.get_latest_news()
+        return self.update_estimates(news_data)
+
+    def process_news_update(self, new_items):
+        """
+        Same as full_process_news, for news that was already fetched (e.g. as part of the tick's snapshot)
+
+        Args:
+            new_items (list): The news items after last_news_id, None if the fetch failed
+
+        Returns:
+            dict: A dictionary with the estimates for each ticker with key as the ticker and value as the estimate interval as a list
+        """
+        news_data = self.ingest_news(new_items or [])
+        return self.update_estimates(news_data)
+
+    def update_estimates(self, news_data):
+        """
+        Rebuilds the estimates from the news data if new news arrived
+
+        Returns:
+            dict: A dictionary with the estimates for each ticker with key as the ticker and value as the estimate interval as a list
+        """
         estimates = {}
 
         if self.new_news:
-            geb_estimates, ub_estimates = self.process_news(news_data)
-            geb_interval, ub_interval = self.get_processed_interval(geb_estimates, ub_estimates)
+            intervals = self.process_news(news_data)
+            geb_interval = [round(intervals['GEM'][0], 2), round(intervals['GEM'][1], 2)]
+            ub_interval = [round(intervals['UB'][0], 2), round(intervals['UB'][1], 2)]
 
             # Store the estimates in the estimates dictionary
             # The ETF holds 1 of each asset, so we sum the estimates for each ticker
             # ETF = GEM + UB
             estimates['GEM'] = geb_interval
             estimates['UB'] = ub_interval
-            estimates['ETF'] = [geb_interval[0] + ub_interval[0], geb_interval[1] + ub_interval[1]]
+            estimates['ETF'] = [round(geb_interval[0] + ub_interval[0], 2), round(geb_interval[1] + ub_interval[1], 2)]
         
             self.estimates = estimates
+            self.quote_caps = self.calculate_quote_caps(estimates)
 
         return self.estimates
 
+    def calculate_quote_caps(self, estimates):
+        """
+        Precomputes the price limits the quoter clamps its quotes to, so they are only worked out when the estimates change
+        The quotes must clear the commission on the three legs plus a tick beyond the estimate interval
+
+        Args:
+            estimates (dict): The estimate interval for each ticker
+
+        Returns:
+            dict: A dictionary with [ticker] = {'bid_floor', 'bid_cap', 'ask_floor', 'ask_cap'}, all in cents
+        """
+        edge = COMMISSION_CENTS * 3 + TICK_CENTS
+        quote_caps = {}
+
+        for ticker, (low, high) in estimates.items():
+            low, high = round(low * 100), round(high * 100)
+            quote_caps[ticker] = {
+                'bid_floor': low - edge,
+                'bid_cap': high - edge,
+                'ask_floor': low + edge,
+                'ask_cap': high + edge
+            }
+
+        return quote_caps
+
 
 class Quoter:
     """
@@ -183,122 +433,74 @@ class Quoter:
         self.exchange_client = exchange_client
              
 
-    def competitive_quotes(self, consolidated_contra_book):
+    def competitive_quotes(self, top_of_book):
         """
         Calculates the competitive quotes for all tickers based on the contra orderbook and the estimates from the news handler.
+        All prices are in integer cents.
 
         Args:
-            consolidated_contra_book (dict): The orderbook with my quotes removed so I won't self-trade with orders consolidated by price and size
-            It is in the format of {'ticker': {'bids': [[price, size], ...], 'asks': [[price, size], ...]}}
+            top_of_book (TopOfBook): The best bid and ask of the contra orderbook in cents
 
         Returns:
-            dict: A dictionary with [ticker] = [[bid price, bid size], [ask price, ask size]].
+            Quotes: The most competitive quotes for all tickers in TICKERS order
         """
-        COMMISSION = 0.02  # 2 cents per share
-        comp_quotes = {}
-
-        gem_best_bid, gem_best_bid_size = consolidated_contra_book['GEM']['bids'][0] if consolidated_contra_book['GEM']['bids'] else (20, 0)
-        gem_best_ask, gem_best_ask_size = consolidated_contra_book['GEM']['asks'][0] if consolidated_contra_book['GEM']['asks'] else (30, 0)
+        bid_prices, bid_sizes, ask_prices, ask_sizes = [], [], [], []
 
-        ub_best_bid, ub_best_bid_size = consolidated_contra_book['UB']['bids'][0] if consolidated_contra_book['UB']['bids'] else (40, 0)
-        ub_best_ask, ub_best_ask_size = consolidated_contra_book['UB']['asks'][0] if consolidated_contra_book['UB']['asks'] else (60, 0)
-
-        etf_best_bid, etf_best_bid_size = consolidated_contra_book['ETF']['bids'][0] if consolidated_contra_book['ETF']['bids'] else (60, 0)
-        etf_best_ask, etf_best_ask_size = consolidated_contra_book['ETF']['asks'][0] if consolidated_contra_book['ETF']['asks'] else (90, 0)
+        gem_best_bid, ub_best_bid, etf_best_bid = top_of_book.bid_prices
+        gem_best_bid_size, ub_best_bid_size, etf_best_bid_size = top_of_book.bid_sizes
+        gem_best_ask, ub_best_ask, etf_best_ask = top_of_book.ask_prices
+        gem_best_ask_size, ub_best_ask_size, etf_best_ask_size = top_of_book.ask_sizes
         
-        # Use the estimates from the news handler
-        gem_bounds = self.news_handler.estimates['GEM']
-        ub_bounds = self.news_handler.estimates['UB']
-        etf_bounds = self.news_handler.estimates['ETF']
-
-        # Calculate competitive quotes for each ticker
+        # The price each ticker could be laid off at through the other two, as [[bid price, bid size], [ask price, ask size]] in TICKERS order
+        # GEM and UB trade against the ETF and the other leg, the ETF trades against both legs
+        synthetic = (
+            [[etf_best_bid - ub_best_ask, min(ub_best_ask_size, etf_best_bid_size)], [etf_best_ask - ub_best_bid, min(ub_best_bid_size, etf_best_ask_size)]],
+            [[etf_best_bid - gem_best_ask, min(gem_best_ask_size, etf_best_bid_size)], [etf_best_ask - gem_best_bid, min(gem_best_bid_size, etf_best_ask_size)]],
+            [[gem_best_bid + ub_best_bid, min(gem_best_bid_size, ub_best_bid_size)], [gem_best_ask + ub_best_ask, min(gem_best_ask_size, ub_best_ask_size)]]
+        )
+
+        # Calculate competitive quotes for each ticker, the same formula applies to all three
         # Adjust so that the bid is always at least my bottom estimate and the ask is always at most my top estimate
         # Setting a max size of 2,000 shares for all quotes
         MAX_SIZE = 2000
+        edge = COMMISSION_CENTS * 3
+        quote_caps = self.news_handler.quote_caps
 
-        gem_bid = [round(min(etf_best_bid - ub_best_ask - COMMISSION * 3, gem_bounds[1] - COMMISSION * 3 - .01), 2), min(ub_best_ask_size, etf_best_bid_size)]
-        gem_bid = [round(max(gem_bid[0], gem_bounds[0] - COMMISSION * 3 - .01), 2), min(gem_bid[1], MAX_SIZE)]
-
-        gem_ask = [round(max(etf_best_ask - ub_best_bid + COMMISSION * 3, gem_bounds[0] + COMMISSION * 3 + .01), 2), min(ub_best_bid_size, etf_best_ask_size)]
-        gem_ask = [round(min(gem_ask[0], gem_bounds[1] + COMMISSION * 3 + .01), 2), min(gem_ask[1], MAX_SIZE)]
-
-        ub_bid = [round(min(etf_best_bid - gem_best_ask - COMMISSION * 3, ub_bounds[1] - COMMISSION * 3 - .01), 2), min(gem_best_ask_size, etf_best_bid_size)]
-        ub_bid = [round(max(ub_bid[0], ub_bounds[0] - COMMISSION * 3 - .01), 2), min(ub_bid[1], MAX_SIZE)]
-
-        ub_ask = [round(max(etf_best_ask - gem_best_bid + COMMISSION * 3, ub_bounds[0] + COMMISSION * 3 + .01), 2), min(gem_best_bid_size, etf_best_ask_size)]
-        ub_ask = [round(min(ub_ask[0], ub_bounds[1] + COMMISSION * 3 + .01), 2), min(ub_ask[1], MAX_SIZE)]
+        for ticker, ((synthetic_bid, bid_size), (synthetic_ask, ask_size)) in zip(TICKERS, synthetic):
+            # Use the limits precomputed from the news handler's estimates, in cents
+            caps = quote_caps[ticker]
 
-        etf_bid = [round(min(gem_best_bid + ub_best_bid - COMMISSION * 3, etf_bounds[1] - COMMISSION * 3 - .01), 2), min(gem_best_bid_size, ub_best_bid_size)]
-        etf_bid = [round(max(etf_bid[0], etf_bounds[0] - COMMISSION * 3 - .01), 2), min(etf_bid[1], MAX_SIZE)]
+            bid = max(min(synthetic_bid - edge, caps['bid_cap']), caps['bid_floor'])
+            ask = min(max(synthetic_ask + edge, caps['ask_floor']), caps['ask_cap'])
 
-        etf_ask = [round(max(gem_best_ask + ub_best_ask + COMMISSION * 3, etf_bounds[0] + COMMISSION * 3 + .01), 2), min(gem_best_ask_size, ub_best_ask_size)]
-        etf_ask = [round(min(etf_ask[0], etf_bounds[1] + COMMISSION * 3 + .01), 2), min(etf_ask[1], MAX_SIZE)]
+            bid_prices.append(bid)
+            bid_sizes.append(min(bid_size, MAX_SIZE))
+            ask_prices.append(ask)
+            ask_sizes.append(min(ask_size, MAX_SIZE))
 
-        # Store the quotes
-        comp_quotes['GEM'] = [gem_bid, gem_ask]
-        comp_quotes['UB'] = [ub_bid, ub_ask]
-        comp_quotes['ETF'] = [etf_bid, etf_ask]
-
-        return comp_quotes
+        return Quotes(bid_prices, bid_sizes, ask_prices, ask_sizes)
     
-    def optimize_quotes(self, competitive_quotes, consolidated_contra_book):
+    def optimize_quotes(self, competitive_quotes, top_of_book):
         """
         Optimizes the quotes making sure that I'm only top of the book and not overly competitive. If I'd buy at 20 but the best bid is 19.50, I should bid 19.51
         This function, like competitive quotes, is completely indifferent of my current quotes
+        All prices are in integer cents.
         
         Args:
-            competitive_quotes (dict): The most competitive quotes for all tickers that would still make me money
-            full_orderbook (dict): The orderbook with all orders in the market, including the ones with my trader id
+            competitive_quotes (Quotes): The most competitive quotes for all tickers that would still make me money
+            top_of_book (TopOfBook): The best bid and ask of the contra orderbook in cents
             
         Response:
-            dict: A dictionary with [ticker] = [[bid price, bid size], [ask price, ask size]]     
+            Quotes: New quotes with the prices pulled back to one tick inside the market, competitive_quotes is left unchanged
         """
-        optimized_quotes = {}
-
-        # Get the best bid and ask price only
-        gem_best_bid = consolidated_contra_book['GEM']['bids'][0][0] if consolidated_contra_book['GEM']['bids'] else 20
-        gem_best_ask = consolidated_contra_book['GEM']['asks'][0][0] if consolidated_contra_book['GEM']['asks'] else 30
-
-        ub_best_bid = consolidated_contra_book['UB']['bids'][0][0] if consolidated_contra_book['UB']['bids'] else 40
-        ub_best_ask = consolidated_contra_book['UB']['asks'][0][0] if consolidated_contra_book['UB']['asks'] else 60
-
-        etf_best_bid = consolidated_contra_book['ETF']['bids'][0][0] if consolidated_contra_book['ETF']['bids'] else 60
-        etf_best_ask = consolidated_contra_book['ETF']['asks'][0][0] if consolidated_contra_book['ETF']['asks'] else 90
-
-        # Extract my price information
-        my_gem_bid = competitive_quotes['GEM'][0][0]
-        my_gem_ask = competitive_quotes['GEM'][1][0]
-
-        my_ub_bid = competitive_quotes['UB'][0][0]
-        my_ub_ask = competitive_quotes['UB'][1][0]
-
-        my_etf_bid = competitive_quotes['ETF'][0][0]
-        my_etf_ask = competitive_quotes['ETF'][1][0]
-
         # Check where my quotes would compare to the best quotes in the market
         # If my bid is better than the best bid, I should be at the best bid + 0.01, vice versa for the ask
         # Otherwise, if the market is more competitive, I just leave the quotes as they are
-        if my_gem_bid > gem_best_bid:
-            competitive_quotes['GEM'][0][0] = round(gem_best_bid + 0.01, 2)
-
-        if my_gem_ask < gem_best_ask:
-            competitive_quotes['GEM'][1][0] = round(gem_best_ask - 0.01, 2)
-
-        if my_ub_bid > ub_best_bid:
-            competitive_quotes['UB'][0][0] = round(ub_best_bid + 0.01, 2)
-
-        if my_ub_ask < ub_best_ask:
-            competitive_quotes['UB'][1][0] = round(ub_best_ask - 0.01, 2)
+        # With whole cents, min/max against one tick inside the best price does this without branching
+        bid_prices = [min(bid, best_bid + TICK_CENTS) for bid, best_bid in zip(competitive_quotes.bid_prices, top_of_book.bid_prices)]
+        ask_prices = [max(ask, best_ask - TICK_CENTS) for ask, best_ask in zip(competitive_quotes.ask_prices, top_of_book.ask_prices)]
 
-        if my_etf_bid > etf_best_bid:
-            competitive_quotes['ETF'][0][0] = round(etf_best_bid + 0.01, 2)
-
-        if my_etf_ask < etf_best_ask:
-            competitive_quotes['ETF'][1][0] = round(etf_best_ask - 0.01, 2)
-
-        optimized_quotes['GEM'] = competitive_quotes['GEM']
-        optimized_quotes['UB'] = competitive_quotes['UB']
-        optimized_quotes['ETF'] = competitive_quotes['ETF']
+        optimized_quotes = Quotes(bid_prices, competitive_quotes.bid_sizes, ask_prices, competitive_quotes.ask_sizes)
 
         return optimized_quotes
     
@@ -307,48 +509,23 @@ class Quoter:
         Adjusts the quotes based on the positions in the market. If I am too long or too short, I should adjust my quotes accordingly.
         
         Args:
-            optimized_quotes (dict): The quotes for the given ticker, dictionary of dictionaries with {'ticker': [[bid price, bid size], [ask price, ask size]], ...}.
-            positions (dict): The positions by ticker key
+            optimized_quotes (Quotes): The optimized quotes for all tickers
+            positions (PositionState): My positions with their skews
             
         Returns:
-            adjusted_quotes (dict): The adjusted quotes for the given ticker, dictionary of dictionaries with {'ticker': [[bid price, bid size], [ask price, ask size]], ...}.
+            adjusted_quotes (Quotes): The quotes with the sizes scaled by the position skew, prices unchanged
             """
-        adjusted_quotes = {}
-        
-        # Quotes are adjusted based on their relative positions to the limits on the positions
-        def get_position_skew(ticker, position):
-            # We first normalize on a 0-1 scale based on the position limits and then translate to a -1 to 1 scale
-            if ticker == 'GEM':
-                zero_one_normalized_position = (position + POSITION_LIMITS['GEM']) / (2 * POSITION_LIMITS['GEM'])
-                neg_one_one_position = (zero_one_normalized_position - 0.5) * 2
-                return neg_one_one_position
-            elif ticker == 'UB':
-                zero_one_normalized_position = (position + POSITION_LIMITS['UB']) / (2 * POSITION_LIMITS['UB'])
-                neg_one_one_position = (zero_one_normalized_position - 0.5) * 2
-                return neg_one_one_position
-            elif ticker == 'ETF':
-                zero_one_normalized_position = (position + POSITION_LIMITS['ETF']) / (2 * POSITION_LIMITS['ETF'])
-                neg_one_one_position = (zero_one_normalized_position - 0.5) * 2
-                return neg_one_one_position
-            
+        # Quotes are adjusted based on their relative positions to the limits on the positions, see PositionState.skews
 
-        # I am going to scale my size by new_size = old size * (1 + position skew)
+        # I am going to scale my size by new_size = old size * (1 + position skew), rounded by adding 0.5 and truncating since sizes aren't negative
         # So if my skew is negative, my bid size will be smaller and my ask size will be larger
         # If my skew is positive, my bid size will be larger and my ask size will be smaller
-        for ticker in optimized_quotes.keys():
-            position = positions[ticker]
-            position_skew = get_position_skew(ticker, position)
-
-            bid_size = optimized_quotes[ticker][0][1]
-            ask_size = optimized_quotes[ticker][1][1]
+        skews = positions.skews
 
-            new_bid_size = round(bid_size * (1 - position_skew))
-            new_ask_size = round(ask_size * (1 + position_skew))
+        new_bid_sizes = [int(bid_size * (1 - position_skew) + 0.5) for bid_size, position_skew in zip(optimized_quotes.bid_sizes, skews)]
+        new_ask_sizes = [int(ask_size * (1 + position_skew) + 0.5) for ask_size, position_skew in zip(optimized_quotes.ask_sizes, skews)]
 
-            adjusted_quotes[ticker] = [
-                [optimized_quotes[ticker][0][0], new_bid_size],
-                [optimized_quotes[ticker][1][0], new_ask_size]
-            ]
+        adjusted_quotes = Quotes(optimized_quotes.bid_prices, new_bid_sizes, optimized_quotes.ask_prices, new_ask_sizes)
 
         return adjusted_quotes
     
@@ -358,17 +535,16 @@ class Quoter:
         If they are better, we should send them to the exchange.
 
         Args:
-            current_quotes (dict): The current quotes for the given ticker, once a side specified it's a list of orders with {'ticker': {'bids': [{'price':, 'size':, 'order_id':}, ...]}}.
-            adjusted_quotes (dict): The adjusted quotes for the given ticker, dictionary of dictionaries with {'ticker': [[bid price, bid size], [ask price, ask size]], ...}.
+            current_quotes (dict): The current quotes for the given ticker, once a side specified it's a list of orders with {'ticker': {'bids': [(price, size, order_id), ...]}}.
+            adjusted_quotes (Quotes): The adjusted quotes for all tickers, prices in cents
 
         Returns:
-
-            list: A list of orders to send to the exchange.
+            tuple: A list of orders to send to the exchange and a list of the order ids to cancel, nothing is sent here
         """
         orders_to_send = []
         orders_to_cancel = []
 
-        for ticker in adjusted_quotes.keys():
+        for ticker, bid_price, bid_size, ask_price, ask_size in zip(TICKERS, adjusted_quotes.bid_prices, adjusted_quotes.bid_sizes, adjusted_quotes.ask_prices, adjusted_quotes.ask_sizes):
             # Get current quotes for the ticker, default to empty if not present
             current_ticker_quotes = current_quotes.get(ticker, {'bids': [], 'asks': []})    
 
@@ -378,56 +554,52 @@ class Quoter:
             # Check bids
             if not current_bid:
                 # No current bid, send the adjusted bid
-                if adjusted_quotes[ticker][0][1] > 0:
+                if bid_size > 0:
                     orders_to_send.append({
                         'ticker': ticker,
                         'type': 'LIMIT',
-                        'price': adjusted_quotes[ticker][0][0],
-                        'quantity': adjusted_quotes[ticker][0][1],
+                        'price': bid_price / 100,
+                        'quantity': bid_size,
                         'action': 'BUY'
                     })
             else:
                 # Compare current bid with adjusted bid
-                if adjusted_quotes[ticker][0][1] > 0 and adjusted_quotes[ticker][0][0] != current_bid['price']:
+                if bid_size > 0 and bid_price != int(current_bid[0] * 100 + 0.5):
                     # Cancel the current bid and send the new one
-                    orders_to_cancel.append(current_bid['order_id'])
+                    orders_to_cancel.append(current_bid[2])
                     orders_to_send.append({
                         'ticker': ticker,
                         'type': 'LIMIT',
-                        'price': adjusted_quotes[ticker][0][0],
-                        'quantity': adjusted_quotes[ticker][0][1],
+                        'price': bid_price / 100,
+                        'quantity': bid_size,
                         'action': 'BUY'
                     })
 
             # Check asks
             if not current_ask:
                 # No current ask, send the adjusted ask
-                if adjusted_quotes[ticker][1][1] > 0:
+                if ask_size > 0:
                     orders_to_send.append({
                         'ticker': ticker,
                         'type': 'LIMIT',
-                        'price': adjusted_quotes[ticker][1][0],
-                        'quantity': adjusted_quotes[ticker][1][1],
+                        'price': ask_price / 100,
+                        'quantity': ask_size,
                         'action': 'SELL'
                     })
             else:
                 # Compare current ask with adjusted ask
-                if adjusted_quotes[ticker][1][1] > 0 and adjusted_quotes[ticker][1][0] != current_ask['price']:
+                if ask_size > 0 and ask_price != int(current_ask[0] * 100 + 0.5):
                     # Cancel the current ask and send the new one
-                    orders_to_cancel.append(current_ask['order_id'])
+                    orders_to_cancel.append(current_ask[2])
                     orders_to_send.append({
                         'ticker': ticker,
                         'type': 'LIMIT',
-                        'price': adjusted_quotes[ticker][1][0],
-                        'quantity': adjusted_quotes[ticker][1][1],
+                        'price': ask_price / 100,
+                        'quantity': ask_size,
                         'action': 'SELL'
                     })
 
-        # Cancel the orders that are no longer valid
-        if orders_to_cancel:
-            self.exchange_client.cancel_all_orders(order_ids=orders_to_cancel)
-
-        return orders_to_send
+        return orders_to_send, orders_to_cancel
     
     def validate_orders(orders):
         """
@@ -441,30 +613,49 @@ class Quoter:
             
         return True
     
-    def calculate_and_send_orders(self, contra_orderbook):
+    def calculate_orders(self, contra_orderbook, current_quotes=None, positions=None, top_of_book=None):
         """
-        Calculates the quotes for the given orderbooks and estimates from the news handler
+        Calculates the quotes for the given orderbooks and estimates from the news handler and what has to change on the exchange,
+        without sending anything
         
         Args:
-            current_quotes (dict): The current quotes for the given ticker
-            full_orderbook (dict): The orderbook with all orders in the marekt
             contra_orderbook (dict): The orderbook with my quotes removed
+            current_quotes (dict, optional): My current quotes from exchange_client.get_quotes, fetched if not given
+            positions (PositionState, optional): My positions, fetched if not given
+            top_of_book (TopOfBook, optional): The best bid and ask of contra_orderbook, extracted if not given
 
         Response:
-            dict: A dictionary with [ticker] = [[bid price, bid size], [ask price, ask size]]     
+            tuple: A list of orders to send and a list of the order ids to cancel
         """
-        current_quotes = self.exchange_client.get_quotes()
+        if current_quotes is None:
+            current_quotes = self.exchange_client.get_quotes()
+        if positions is None:
+            positions = PositionState(self.exchange_client.get_positions())
 
-        competitive_quotes = self.competitive_quotes(contra_orderbook)
-        optimized_quotes = self.optimize_quotes(competitive_quotes, contra_orderbook)
-        adjusted_quotes = self.adjust_quotes(optimized_quotes, self.exchange_client.get_positions())
+        if top_of_book is None:
+            top_of_book = TopOfBook(contra_orderbook)
 
-        orders_to_send = self.check_against_current_quotes(current_quotes, adjusted_quotes)
+        competitive_quotes = self.competitive_quotes(top_of_book)
+        optimized_quotes = self.optimize_quotes(competitive_quotes, top_of_book)
+        adjusted_quotes = self.adjust_quotes(optimized_quotes, positions)
+
+        orders_to_send, orders_to_cancel = self.check_against_current_quotes(current_quotes, adjusted_quotes)
 
         for order in orders_to_send:
             if order['quantity'] > 5000:
                 order['quantity'] = 5000
-            self.exchange_client.create_order(order)
+
+        return orders_to_send, orders_to_cancel
+
+    def calculate_and_send_orders(self, contra_orderbook, current_quotes=None, positions=None, top_of_book=None):
+        """
+        Calculates the quotes with calculate_orders and sends them to the exchange, see calculate_orders for the arguments
+        """
+        orders_to_send, orders_to_cancel = self.calculate_orders(contra_orderbook, current_quotes, positions, top_of_book)
+
+        # Cancelling the stale quotes and creating the new ones don't depend on each other, so they are all sent at once
+        # The stale quotes go in one bulk cancel request
+        self.exchange_client.send_orders(orders_to_send, orders_to_cancel)
 
 
 class Hitter:
@@ -477,45 +668,25 @@ class Hitter:
         self.new_news = news_handler.new_news
 
         
-    def check_orderbook_mispricing(self, consolidated_contra_book, estimates):
+    def check_orderbook_mispricing(self, top_of_book, estimates):
         """
         This function checks the orderbook for mispricing. It is called when there is new news.
         It should also be only called after my quotes are cancelled.
 
         Args:
-            consolidated_contra_book (dict): The orderbook with my quotes removed so I won't self-trade.
+            top_of_book (TopOfBook): The best bid and ask of the orderbook with my quotes removed so I won't self-trade, in cents.
             estimates (dict): The estimates for each ticker from the news handler.
 
         Returns:
-            dict: A dictionary with the structure:
-                {
-                    'GEM': {'bid': False, 'ask': False},
-                    'UB': {'bid': False, 'ask': False},
-                    'ETF': {'bid': False, 'ask': False}
-                }
+            dict: A dictionary with the structure {'bid': [gem, ub, etf], 'ask': [gem, ub, etf]} of bools in TICKERS order,
+            'bid' is True where the best bid is above the upper estimate and 'ask' is True where the best ask is below the lower estimate
         """
+        # Check for mispricing on both sides in one pass each, comparing in cents
         mispricing = {
-            'GEM': {'bid': False, 'ask': False},
-            'UB': {'bid': False, 'ask': False},
-            'ETF': {'bid': False, 'ask': False}
+            'bid': [best_bid > int(estimates[ticker][1] * 100 + 0.5) for ticker, best_bid in zip(TICKERS, top_of_book.bid_prices)],
+            'ask': [best_ask < int(estimates[ticker][0] * 100 + 0.5) for ticker, best_ask in zip(TICKERS, top_of_book.ask_prices)]
         }
 
-        # Extract the best bid and ask prices for each ticker
-        for ticker in ['GEM', 'UB', 'ETF']:
-            best_bid = consolidated_contra_book[ticker]['bids'][0][0] if consolidated_contra_book[ticker]['bids'] else 20
-            best_ask = consolidated_contra_book[ticker]['asks'][0][0] if consolidated_contra_book[ticker]['asks'] else 90
-
-            bounds = estimates[ticker]
-            lower_bound, upper_bound = bounds
-
-            # Check for mispricing on the bid side
-            if best_bid > upper_bound:
-                mispricing[ticker]['bid'] = True
-
-            # Check for mispricing on the ask side
-            if best_ask < lower_bound:
-                mispricing[ticker]['ask'] = True
-
         return mispricing
     
     def get_size_to_price(self, ticker, consolidated_contra_book, estimate, side):    
@@ -530,21 +701,18 @@ class Hitter:
         Returns:
             int: Thet total size available outside of the estimate range
         """
-        total_size = 0
-
-        # Check the side of the orderbook to calculate the size to price
+        # The book is sorted best price first, so the levels through the estimate are a prefix found by binary search
+        # Bids are descending, so search on the negated price to get an ascending key
         if side == 'bid':
-            bids = consolidated_contra_book[ticker]['bids'] if consolidated_contra_book[ticker]['bids'] else []
-            for price, size in bids:
-                if price < estimate:
-                    break
-                total_size += size
+            levels = consolidated_contra_book[ticker]['bids']
+            depth = bisect_right(levels, -estimate, key=_negated_price)
         elif side == 'ask':
-            asks = consolidated_contra_book[ticker]['asks'] if consolidated_contra_book[ticker]['asks'] else []
-            for price, size in asks:
-                if price > estimate:
-                    break
-                total_size += size
+            levels = consolidated_contra_book[ticker]['asks']
+            depth = bisect_right(levels, estimate, key=_level_price)
+        else:
+            return 0
+
+        total_size = sum(map(_level_size, levels[:depth]))
 
         return total_size
     
@@ -556,7 +724,7 @@ class Hitter:
         Args:
             consolidated_contra_book (dict): The orderbook with my quotes removed so I won't self-trade.
             estimates (dict): The estimates for each ticker from the news handler.
-            mispricings (dict): The mispricing for each ticker from the news handler.
+            mispricings (dict): The mispricing flags from check_orderbook_mispricing, {'bid': [...], 'ask': [...]} in TICKERS order.
 
         Returns:
             dict: A dictionary with the total size on each side of the orderbook for each ticker [ticker] = {'bid': size, 'ask': size}
@@ -565,8 +733,8 @@ class Hitter:
 
         # First check for each ticker if there is a ask below my bottom estimate or an bid above my top estimate
         # Then I would want to hit the bid or ask respectively
-        for ticker in ['GEM', 'UB', 'ETF']:
-            if mispricings[ticker]['bid']:
+        for ticker, bid_mispriced, ask_mispriced in zip(TICKERS, mispricings['bid'], mispricings['ask']):
+            if bid_mispriced:
                 # There is a mispriced bid, aka a bid above the upper estimate
                 upper_estimate = estimates[ticker][1]
 
@@ -577,7 +745,7 @@ class Hitter:
                 # There is no mispriced bid, aka a bid below the upper estimate
                 total_size[ticker]['bid'] = 0
 
-            if mispricings[ticker]['ask']:
+            if ask_mispriced:
                 # There is a mispriced ask, aka an ask below the lower estimate
                 lower_estimate = estimates[ticker][0]
 
@@ -609,29 +777,15 @@ class Hitter:
             bid_size = total_size[ticker]['bid']
             ask_size = total_size[ticker]['ask']
 
+            # The exchange caps each order at 5,000 shares, so the size is sliced into full 5,000 share orders
+            # The slices are identical and never mutated, so the prebuilt order is shared by all of them
             if bid_size > 0:
                 number_of_orders = int(bid_size // 5000)
-
-                for i in range(number_of_orders):
-                    order = {
-                        'ticker': ticker,
-                        'type': 'MARKET',
-                        'quantity': 5000,
-                        'action': 'SELL'
-                    }
-                    orders.append(order)
+                orders.extend([MARKET_SLICE_ORDERS[ticker, 'SELL']] * number_of_orders)
 
             if ask_size > 0:
                 number_of_orders = int(ask_size // 5000)
-
-                for i in range(number_of_orders):
-                    order = {
-                        'ticker': ticker,
-                        'type': 'MARKET',
-                        'quantity': 5000,
-                        'action': 'BUY'
-                    }
-                    orders.append(order)    
+                orders.extend([MARKET_SLICE_ORDERS[ticker, 'BUY']] * number_of_orders)
 
         if orders == []:
             return None
@@ -639,60 +793,79 @@ class Hitter:
         return orders
 
     
-    def hit_to_estimates(self, orders):
+    def hit_to_estimates(self, orders, positions=None):
         """
         This function takes the orders and sends them to the exchange as long as they wouldn't be rejected
         
         Args:
             orders (list): A list of orders to be sent to the exchange.
+            positions (PositionState, optional): My current positions, fetched if not given. Not modified.
+
+        Returns:
+            int: The number of orders sent.
         """
+        if orders is None:
+            return 0
 
-        if orders is not None:
-            for order in orders:
-                # First, get my positions so I stay within the position limits
-                positions = self.exchange_client.get_positions()
-                gross_positions = sum(abs(value) for value in positions.values())  
+        # Get my positions once and track the effect of each accepted order locally so I stay within the position limits
+        if positions is None:
+            positions = PositionState(self.exchange_client.get_positions())
+        gross_positions = positions.gross
+        limits = positions.limits
+        positions = list(positions.positions)
+        accepted = []
 
-                ticker = order['ticker']
-                action = order['action']
-                quantity = order['quantity']
+        gross_limit = GROSS_POSITION_LIMIT
 
-                # Calculate the new gross position if this order is executed
-                if action == 'BUY':
-                    # Buying increases gross position if already long, decreases if short
-                    new_gross_positions = gross_positions + quantity if positions[ticker] >= 0 else gross_positions - abs(quantity)
-                elif action == 'SELL':
-                    # Selling decreases gross position if already long, increases if short
-                    new_gross_positions = gross_positions - quantity if positions[ticker] > 0 else gross_positions + abs(quantity)
+        for order in orders:
+            index = TICKER_INDEX[order['ticker']]
+            quantity = order['quantity'] if order['action'] == 'BUY' else -order['quantity']
 
-                # Check gross position limit
-                if new_gross_positions > 100000:
-                    continue
+            # Calculate the new position and gross position if this order is executed
+            position = positions[index]
+            new_position = position + quantity
+            new_gross_positions = gross_positions - abs(position) + abs(new_position)
 
-                if action == 'BUY':
-                    if positions[ticker] + quantity > POSITION_LIMITS[ticker]:
-                        continue
+            # Check the gross position limit, and the ticker's position limit only on the side the order grows
+            # so a position already past its limit can still be traded back toward it
+            if new_gross_positions > gross_limit:
+                continue
+            if quantity > 0 and new_position > limits[index]:
+                continue
+            if quantity < 0 and new_position < -limits[index]:
+                continue
 
-                elif action == 'SELL':
-                    if positions[ticker] - quantity < -POSITION_LIMITS[ticker]:
-                        continue
+            positions[index] = new_position
+            gross_positions = new_gross_positions
+            accepted.append(order)
 
-                self.exchange_client.create_order(order)
+        # The accepted orders don't depend on each other, so they are sent concurrently
+        self.exchange_client.send_orders(accepted)
+        sent = len(accepted)
 
+        return sent
 
-    def run(self, consolidated_contra_book, estimates):
+    def run(self, consolidated_contra_book, estimates, top_of_book=None, positions=None):
         """
         This function runs the hitter logic. It checks for mispricing and hits to the market if there is any.
         
         Args:
             consolidated_contra_book (dict): The orderbook with my quotes removed so I won't self-trade.
             estimates (dict): The estimates for each ticker from the news handler.
+            top_of_book (TopOfBook, optional): The best bid and ask of consolidated_contra_book, extracted if not given
+            positions (PositionState, optional): My current positions, fetched only if there is something to hit and they aren't given
+
+        Returns:
+            bool: True if any orders were sent, meaning my positions changed.
         """
-        mispricing = self.check_orderbook_mispricing(consolidated_contra_book, estimates)
+        if top_of_book is None:
+            top_of_book = TopOfBook(consolidated_contra_book)
+
+        mispricing = self.check_orderbook_mispricing(top_of_book, estimates)
         total_size = self.get_total_size(consolidated_contra_book, estimates, mispricing)
 
         orders = self.hit_to_estimate_orders(total_size)
-        self.hit_to_estimates(orders)
+        return self.hit_to_estimates(orders, positions) > 0
 
     def hit_to_market(self):
         """
@@ -702,6 +875,55 @@ class Hitter:
 
 
 
+# The remedy for a skew is the opposite of the skew ratio for the stocks and in the direction of it for the ETF
+REMEDY_SIGNS = (-1, -1, 1)
+
+
+@lru_cache(maxsize=128)
+def _ratio(expected_values):
+    """
+    The ratio of the positions to take in each market for Controller.get_ratio, both in TICKERS order
+    """
+    total = sum(expected_values)
+
+    if total == 0:
+        return (0,) * len(expected_values)
+
+    return tuple(int(expected_value / total * 100 + 0.5) / 100 for expected_value in expected_values)
+
+
+@lru_cache(maxsize=128)
+def _remedy(position_skew, ratio):
+    """
+    The change in position that resolves the skew for Controller.remedy_skew, in TICKERS order
+    """
+    remedy = []
+    for sign, ticker_ratio in zip(REMEDY_SIGNS, ratio):
+        skew = ticker_ratio * position_skew
+        remedy.append(sign * int(skew + (0.5 if skew >= 0 else -0.5)))
+
+    return tuple(remedy)
+
+
+def pin_trading_thread(core=None, realtime_priority=None):
+    """
+    Pins the calling thread to one CPU core and optionally moves it to the SCHED_FIFO real time scheduler,
+    so the tick loop isn't migrated between cores or preempted by ordinary processes. Only available on Linux.
+    Threads started afterwards from this thread inherit both settings.
+
+    Args:
+        core (int, optional): The CPU core to pin to, None to not pin
+        realtime_priority (int, optional): The SCHED_FIFO priority, None to keep the current scheduler
+    """
+    try:
+        if core is not None:
+            os.sched_setaffinity(0, {core})
+        if realtime_priority is not None:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(realtime_priority))
+    except (AttributeError, OSError) as e:
+        print(f"Could not pin the trading thread: {e}")
+
+
 class Controller:
 
     """
@@ -713,6 +935,11 @@ class Controller:
         self.news_handler = news_handler
         self.quoter = Quoter(exchange_client, news_handler)
         self.hitter = Hitter(exchange_client, news_handler)
+        self.book_manager = BookManager(exchange_client, max_depth=HITTER_MAX_DEPTH)
+
+        self.latency = LatencyTracker()
+        if LATENCY_STATS_PORT is not None:
+            self.latency.serve(LATENCY_STATS_PORT)
 
         self.mode = 'quoter' # 'quoter' or 'hitter'
         self.trading_state = 'active'  # active or inactive
@@ -743,68 +970,107 @@ class Controller:
     def get_ratio(self, expected_values):
         """
         This function takes in the expected values and returns the ratio of the positions to take in each market
+
+        Returns:
+            tuple: The ratio for each ticker in TICKERS order
         """
         # Get the expected values from the news handler
-        gem_expected_value = expected_values['GEM']
-        ub_expected_value = expected_values['UB']
-        etf_expected_value = expected_values['ETF']
-
-        sum = gem_expected_value + ub_expected_value + etf_expected_value
-
-        if sum == 0:
-            return {'GEM': 0, 'UB': 0, 'ETF': 0}
-        
-        ratio = {
-            'GEM': round(gem_expected_value / sum, 2),
-            'UB': round(ub_expected_value / sum, 2),
-            'ETF': round(etf_expected_value / sum, 2)
-        }
-
-        return ratio
+        # The expected values only change with news, so the ratio is memoized on them
+        return _ratio(tuple(expected_values[ticker] for ticker in TICKERS))
     
     def remedy_skew(self, position_skew, ratio):  
         """
-        This function takes in a skew and returns the necessary change in position to resolve the skew as a dict
-        """
-        remedy = {'GEM': 0, 'UB': 0, 'ETF': 0}
-        
-        skew_ratio = {
-            'GEM': ratio['GEM'] * position_skew,
-            'UB': ratio['UB'] * position_skew,
-            'ETF': ratio['ETF'] * position_skew
-        }
+        This function takes in a skew and returns the necessary change in position to resolve the skew
 
-        # The action to remedy is the opposite of the current skew ratio
-        remedy['GEM'] = - round(skew_ratio['GEM'])
-        remedy['UB'] = - round(skew_ratio['UB'])
-        remedy['ETF'] = round(skew_ratio['ETF'])
+        Args:
+            position_skew (float): The position skew to resolve
+            ratio (tuple): The ratio for each ticker in TICKERS order, from get_ratio
 
-        return remedy
+        Returns:
+            tuple: The change in position for each ticker in TICKERS order
+        """
+        return _remedy(position_skew, ratio)
     
 
     def run(self):
         """
         Runs the main logic of the trader. It checks for new news and switches between the quoter and hitter modes.
         """
-        trading_state = self.exchange_client.get_status()
-        while trading_state:
+        last_market_state = None
+
+        # The case status is polled on a background thread, so the loop only checks a flag
+        active = self.exchange_client.start_status_watcher()
+
+        # Pin after the status watcher starts so it doesn't inherit the trading thread's core and priority
+        pin_trading_thread(TRADER_CORE, TRADER_REALTIME_PRIORITY)
+
+        # Fetch the news, orderbooks, resting orders and positions for the first tick concurrently
+        snapshot = self.exchange_client.snapshot(news_since=self.news_handler.last_news_id, include_case=False)
+
+        while active.is_set():
+            tick_start = time.perf_counter_ns()
+
             # Get estimate intervals and expected values
-            estimates = self.news_handler.full_process_news()
+            estimates = self.news_handler.process_news_update(snapshot['news'])
 
             # Check if there is any orderbook mispricing, this gets first priority
-            consolidated_contra_book = self.exchange_client.get_consolidated_orderbook(self.exchange_client.get_contra_orderbooks())
+            # Only the tickers whose book changed since the last tick are consolidated again
+            consolidated_contra_book = self.book_manager.update(snapshot['orderbooks'])
         
-            self.hitter.run(consolidated_contra_book, estimates)
-
-            self.quoter.calculate_and_send_orders(consolidated_contra_book)
+            # The best bid and ask of each ticker are extracted once and shared by the hitter and the quoter
+            top_of_book = TopOfBook(consolidated_contra_book)
+
+            # My positions with their limits and skews, shared by the hitter and the quoter
+            position_state = PositionState(snapshot['positions'])
+
+            # Everything the hitter and quoter act on, if none of it changed since the last tick there is nothing to do
+            market_state = (
+                tuple(tuple(estimates[ticker]) for ticker in TICKERS),
+                tuple(top_of_book.bid_prices), tuple(top_of_book.bid_sizes),
+                tuple(top_of_book.ask_prices), tuple(top_of_book.ask_sizes),
+                tuple(position_state.positions),
+                tuple((order['order_id'], order['quantity_filled']) for order in snapshot['orders'] or ())
+            )
+
+            orders_to_send, orders_to_cancel = [], []
+            # News that doesn't move the estimates leaves the orders the same too, so it doesn't force a rerun
+            if market_state == last_market_state:
+                # Quiet market, back off before polling again instead of rerunning the quoter on the same data
+                time.sleep(IDLE_POLL_INTERVAL)
+            else:
+                last_market_state = market_state
+
+                # Only hit if the book is still fresh, the time spent since it arrived is time the market could have moved
+                book_age = time.monotonic_ns() - snapshot['captured_ns']
+                self.latency.record('book_age', book_age // 1000)
+
+                # The snapshot's positions are current, so the hitter can check its limits without another round trip
+                hitter_start = time.perf_counter_ns()
+                traded = False
+                if book_age <= MAX_BOOK_AGE_NS:
+                    traded = self.hitter.run(consolidated_contra_book, estimates, top_of_book, position_state)
+                else:
+                    # The hitter never saw this state, so don't let the idle check skip it once a fresh book arrives
+                    last_market_state = None
+                self.latency.record('hitter', (time.perf_counter_ns() - hitter_start) // 1000)
+
+                # The hitter's trades make the snapshot positions stale, so the quoter refetches them in that case
+                current_quotes = self.exchange_client.parse_quotes(snapshot['orders'])
+                positions = None if traded else position_state
+                orders_to_send, orders_to_cancel = self.quoter.calculate_orders(consolidated_contra_book, current_quotes, positions, top_of_book)
+                self.latency.record('decide', (time.perf_counter_ns() - tick_start) // 1000)
+
+            # Send this tick's quotes while the next tick's news and orderbooks are already being fetched
+            io_start = time.perf_counter_ns()
+            snapshot = self.exchange_client.send_orders_and_snapshot(orders_to_send, orders_to_cancel, news_since=self.news_handler.last_news_id, include_case=False)
+
+            tick_end = time.perf_counter_ns()
+            self.latency.record('orders_and_market_data', (tick_end - io_start) // 1000)
+            self.latency.record('tick', (tick_end - tick_start) // 1000)
 
             # time.sleep(.2)
-            trading_state = self.exchange_client.get_status()
-            if not trading_state:
-                print('Trader is inactive')
-                break
-            
 
+        print('Trader is inactive')
 
 
 exchange_client = Exchange_Client(API_KEY)
@@ -812,5 +1078,12 @@ news_handler = News()
 
 
 controller = Controller(exchange_client, news_handler)
+
+# Everything allocated so far lives for the whole session, so move it out of the garbage collector's generations
+# and the collections that run while trading only scan the short lived per-tick objects
+gc.collect()
+gc.freeze()
+
 controller.run()
+exchange_client.close()
 